@@ -0,0 +1,255 @@
+"""
+Micro-benchmarks for the Lab1 classifiers. They run on synthetic data of
+CIFAR-10 dimensionality so that no dataset download is needed. Run them from
+the Lab1 directory with
+
+python -m scripts.benchmarks [name ...]
+
+where each name is one of the keys of BENCHMARKS (all of them by default).
+"""
+from __future__ import print_function
+
+from builtins import range
+import os
+import time
+
+import numpy as np
+
+from .k_nearest_neighbor import KNearestNeighbor
+from .linear_classifier import LinearSVM, Softmax
+from .linear_svm import svm_loss_vectorized, svm_loss_workspace, svm_workspace
+from .lsh import RandomHyperplaneLSH
+from .softmax import softmax_loss_vectorized
+
+
+def _best_time(fn, repeat=3):
+    """
+    Smallest wall-clock time, in seconds, of repeat calls to fn.
+    """
+    best = np.inf
+    for _ in range(repeat):
+        tic = time.time()
+        fn()
+        best = min(best, time.time() - tic)
+    return best
+
+
+def benchmark_knn_threads(num_train=20000, num_test=2000, dim=3072,
+                          max_jobs=None, k=5):
+    """
+    Queries per second of KNearestNeighbor.predict(streaming=True) as the
+    number of threads grows from 1 to max_jobs (default: number of CPUs).
+    Run with OMP_NUM_THREADS=1 (or the equivalent for your BLAS) so that the
+    BLAS library's own threads do not compete with the pool.
+    """
+    max_jobs = max_jobs or os.cpu_count() or 1
+    X_train = np.random.randn(num_train, dim)
+    y_train = np.random.randint(10, size=num_train)
+    X_test = np.random.randn(num_test, dim)
+    classifier = KNearestNeighbor()
+    classifier.train(X_train, y_train)
+
+    print('kNN streaming predict, %d train x %d test x %d dims'
+          % (num_train, num_test, dim))
+    base = None
+    n_jobs = 1
+    while n_jobs <= max_jobs:
+        t = _best_time(lambda: classifier.predict(X_test, k=k, streaming=True,
+                                                  n_jobs=n_jobs))
+        base = base or t
+        print('n_jobs=%2d: %10.1f queries/sec (%.2fx)'
+              % (n_jobs, num_test / t, base / t))
+        n_jobs *= 2
+
+
+def benchmark_knn_lsh(num_train=20000, num_test=500, dim=3072, k=10,
+                      settings=((4, 16, 0), (8, 12, 0), (8, 12, 2), (16, 10, 2))):
+    """
+    Recall@k and queries per second of approximate kNN search with a
+    RandomHyperplaneLSH index against exact streaming search.
+
+    The data is a mixture of Gaussian clusters so that, as with real images,
+    points have meaningful near neighbors. settings is a sequence of
+    (num_tables, num_bits, num_probes) index configurations.
+    """
+    num_clusters = 50
+    centers = 3 * np.random.randn(num_clusters, dim)
+    X_train = centers[np.random.randint(num_clusters, size=num_train)]
+    X_train += np.random.randn(num_train, dim)
+    y_train = np.random.randint(10, size=num_train)
+    X_test = centers[np.random.randint(num_clusters, size=num_test)]
+    X_test += np.random.randn(num_test, dim)
+
+    classifier = KNearestNeighbor()
+    classifier.train(X_train, y_train)
+    tic = time.time()
+    _, exact = classifier.kneighbors(X_test, k=k)
+    exact_time = time.time() - tic
+    print('kNN LSH search, %d train x %d test x %d dims, k=%d'
+          % (num_train, num_test, dim, k))
+    print('exact:                       %10.1f queries/sec  recall@%d 1.000'
+          % (num_test / exact_time, k))
+
+    for num_tables, num_bits, num_probes in settings:
+        index = RandomHyperplaneLSH(num_tables=num_tables, num_bits=num_bits,
+                                    num_probes=num_probes, seed=0)
+        classifier.train(X_train, y_train, index=index)
+        tic = time.time()
+        _, approx = classifier.kneighbors(X_test, k=k, approximate=True)
+        approx_time = time.time() - tic
+        hits = sum(np.intersect1d(a, e).shape[0] for a, e in zip(approx, exact))
+        print('tables=%2d bits=%2d probes=%d: %10.1f queries/sec  recall@%d %.3f'
+              % (num_tables, num_bits, num_probes, num_test / approx_time, k,
+                 hits / float(num_test * k)))
+
+
+def benchmark_svm_workspace(batch_size=200, dim=3073, num_classes=10,
+                            num_iters=200):
+    """
+    Time per call of the SVM loss as LinearClassifier.train used to evaluate
+    it against the current path, at the minibatch shape used by train.
+
+    Before, train always created W in float64 and called svm_loss_vectorized,
+    so float32 data was upcast to float64 inside every product. Now W takes
+    the dtype of X and LinearSVM calls the allocation-free svm_loss_workspace,
+    so a float32 problem stays float32.
+    """
+    print('SVM loss, batch %d x %d dims x %d classes'
+          % (batch_size, dim, num_classes))
+    y = np.random.randint(num_classes, size=batch_size)
+    W64 = 0.001 * np.random.randn(dim, num_classes)
+    for dtype in (np.float64, np.float32):
+        X = np.random.randn(batch_size, dim).astype(dtype)
+        W = W64.astype(dtype)
+        workspace = svm_workspace(batch_size, dim, num_classes, dtype)
+
+        def run_old():
+            for _ in range(num_iters):
+                svm_loss_vectorized(W64, X, y, 2.5e4)
+
+        def run_new():
+            for _ in range(num_iters):
+                svm_loss_workspace(W, X, y, 2.5e4, workspace)
+
+        t_old = _best_time(run_old) / num_iters
+        t_new = _best_time(run_new) / num_iters
+        print('%-7s X: float64 W + vectorized %8.1f us/iter  '
+              '%s W + workspace %8.1f us/iter  (%.2fx)'
+              % (np.dtype(dtype).name, 1e6 * t_old, np.dtype(dtype).name,
+                 1e6 * t_new, t_old / t_new))
+
+
+def benchmark_softmax_vs_svm(dim=3073, num_classes=10, num_iters=100,
+                             batch_sizes=(200, 1000, 5000)):
+    """
+    Time per call of softmax_loss_vectorized against svm_loss_vectorized at
+    equal batch sizes.
+    """
+    print('Softmax vs SVM loss, %d dims x %d classes' % (dim, num_classes))
+    W = 0.001 * np.random.randn(dim, num_classes)
+    for batch_size in batch_sizes:
+        X = np.random.randn(batch_size, dim)
+        y = np.random.randint(num_classes, size=batch_size)
+
+        def run_softmax():
+            for _ in range(num_iters):
+                softmax_loss_vectorized(W, X, y, 2.5e4)
+
+        def run_svm():
+            for _ in range(num_iters):
+                svm_loss_vectorized(W, X, y, 2.5e4)
+
+        t_softmax = _best_time(run_softmax) / num_iters
+        t_svm = _best_time(run_svm) / num_iters
+        print('batch %5d: softmax %8.1f us/iter  svm %8.1f us/iter  (%.2fx)'
+              % (batch_size, 1e6 * t_softmax, 1e6 * t_svm, t_svm / t_softmax))
+
+
+def _synthetic_classification(num_train, num_val, dim, num_classes,
+                              signal=0.05):
+    """
+    Gaussian data of CIFAR-10 shape whose classes differ by a small mean shift,
+    with a bias column appended as in the Lab1 notebook.
+    """
+    means = signal * np.random.randn(num_classes, dim - 1)
+    y = np.random.randint(num_classes, size=num_train + num_val)
+    X = means[y] + np.random.randn(num_train + num_val, dim - 1)
+    X = np.hstack([X, np.ones((X.shape[0], 1))])
+    return X[:num_train], y[:num_train], X[num_train:], y[num_train:]
+
+
+def benchmark_lbfgs_vs_sgd(num_train=10000, num_val=1000, dim=3073,
+                           num_classes=10, reg=1.0, learning_rate=1e-3,
+                           sgd_iters=(100, 300, 1000, 3000)):
+    """
+    Wall-clock time to validation accuracy of full-batch L-BFGS against
+    minibatch SGD with a fixed learning rate, for LinearSVM and Softmax.
+    """
+    X, y, X_val, y_val = _synthetic_classification(num_train, num_val, dim,
+                                                   num_classes)
+    print('L-BFGS vs SGD, %d train x %d dims, reg %g' % (num_train, dim, reg))
+    for cls in (LinearSVM, Softmax):
+        classifier = cls()
+        tic = time.time()
+        history = classifier.train(X, y, reg=reg, num_iters=200, method='lbfgs')
+        elapsed = time.time() - tic
+        print('%-9s lbfgs %4d iters: %6.2fs  val acc %.3f  loss %.4f'
+              % (cls.__name__, len(history) - 1, elapsed,
+                 np.mean(classifier.predict(X_val) == y_val), history[-1]))
+        for num_iters in sgd_iters:
+            classifier = cls()
+            tic = time.time()
+            classifier.train(X, y, learning_rate=learning_rate, reg=reg,
+                             num_iters=num_iters)
+            elapsed = time.time() - tic
+            print('%-9s sgd   %4d iters: %6.2fs  val acc %.3f  loss %.4f'
+                  % (cls.__name__, num_iters, elapsed,
+                     np.mean(classifier.predict(X_val) == y_val),
+                     classifier.full_loss(X, y, reg)[0]))
+
+
+def benchmark_svm_dual_cd(num_train=10000, num_val=1000, dim=3073,
+                          num_classes=10, reg=1.0, learning_rate=1e-3,
+                          sgd_iters=(300, 1000, 3000)):
+    """
+    Wall-clock time and validation accuracy of LinearSVM.fit (dual coordinate
+    descent, with and without shrinking) against minibatch SGD training.
+    """
+    X, y, X_val, y_val = _synthetic_classification(num_train, num_val, dim,
+                                                   num_classes)
+    print('SVM dual CD vs SGD, %d train x %d dims, reg %g'
+          % (num_train, dim, reg))
+    for shrinking in (True, False):
+        classifier = LinearSVM()
+        tic = time.time()
+        history = classifier.fit(X, y, reg=reg, shrinking=shrinking)
+        elapsed = time.time() - tic
+        print('dual cd shrinking=%-5s %2d passes: %6.2fs  val acc %.3f'
+              % (shrinking, len(history), elapsed,
+                 np.mean(classifier.predict(X_val) == y_val)))
+    for num_iters in sgd_iters:
+        classifier = LinearSVM()
+        tic = time.time()
+        classifier.train(X, y, learning_rate=learning_rate, reg=reg,
+                         num_iters=num_iters)
+        elapsed = time.time() - tic
+        print('sgd %4d iters:                 %6.2fs  val acc %.3f'
+              % (num_iters, elapsed,
+                 np.mean(classifier.predict(X_val) == y_val)))
+
+
+BENCHMARKS = {
+    'knn_lsh': benchmark_knn_lsh,
+    'lbfgs_vs_sgd': benchmark_lbfgs_vs_sgd,
+    'knn_threads': benchmark_knn_threads,
+    'softmax_vs_svm': benchmark_softmax_vs_svm,
+    'svm_dual_cd': benchmark_svm_dual_cd,
+    'svm_workspace': benchmark_svm_workspace,
+}
+
+
+if __name__ == '__main__':
+    import sys
+    for name in sys.argv[1:] or sorted(BENCHMARKS):
+        BENCHMARKS[name]()
+        print()
@@ -126,4 +126,65 @@ def grad_check_sparse(f, x, analytic_grad, num_checks=10, h=1e-5):
         rel_error = (abs(grad_numerical - grad_analytic) /
                     (abs(grad_numerical) + abs(grad_analytic)))
         print('numerical: %f analytic: %f, relative error: %e'
-              %(grad_numerical, grad_analytic, rel_error))
\ No newline at end of file
+              %(grad_numerical, grad_analytic, rel_error))
+
+def grad_check_directional(f, x, analytic_grad, num_checks=10, h=1e-5,
+                           verbose=True):
+    """
+    Check an analytic gradient along a few random directions instead of along
+    every coordinate. For a unit direction v the centered difference
+    (f(x + h v) - f(x - h v)) / 2h should equal <analytic_grad, v>, so each
+    check costs two evaluations of f regardless of the size of x.
+
+    x may also be a dictionary of arrays, such as the params of a model, with
+    analytic_grad a dictionary with the same keys (such as its grads); the
+    direction then spans all of them at once, which checks a full model in
+    2 * num_checks evaluations of f.
+
+    Inputs:
+    - f: A function of x returning a scalar; x is modified in place between
+      calls and restored afterwards.
+    - x: A numpy array, or a dictionary of numpy arrays.
+    - analytic_grad: The gradient of f at x; same structure as x.
+    - num_checks: Number of random directions.
+    - h: Step size along each direction.
+    - verbose: If True, print every check and a summary.
+
+    Returns:
+    - rel_errors: A numpy array of shape (num_checks,) of relative errors.
+    """
+    if isinstance(x, dict):
+        keys = sorted(x)
+        arrays = [x[k] for k in keys]
+        grads = [np.asarray(analytic_grad[k]) for k in keys]
+    else:
+        arrays, grads = [x], [np.asarray(analytic_grad)]
+    originals = [a.copy() for a in arrays]
+
+    rel_errors = np.zeros(num_checks)
+    for i in range(num_checks):
+        directions = [np.random.randn(*a.shape) for a in arrays]
+        norm = np.sqrt(sum(np.vdot(d, d) for d in directions))
+        directions = [d / norm for d in directions]
+
+        for a, a0, d in zip(arrays, originals, directions):
+            a[...] = a0 + h * d
+        fxph = f(x) # evaluate f(x + h v)
+        for a, a0, d in zip(arrays, originals, directions):
+            a[...] = a0 - h * d
+        fxmh = f(x) # evaluate f(x - h v)
+        for a, a0 in zip(arrays, originals):
+            a[...] = a0 # reset
+
+        grad_numerical = (fxph - fxmh) / (2 * h)
+        grad_analytic = sum(np.vdot(g, d) for g, d in zip(grads, directions))
+        denom = abs(grad_numerical) + abs(grad_analytic)
+        rel_errors[i] = abs(grad_numerical - grad_analytic) / denom if denom > 0 else 0.0
+        if verbose:
+            print('numerical: %f analytic: %f, relative error: %e'
+                  %(grad_numerical, grad_analytic, rel_errors[i]))
+    if verbose:
+        print('relative error over %d directions: max %e, median %e, mean %e'
+              %(num_checks, np.max(rel_errors), np.median(rel_errors),
+                np.mean(rel_errors)))
+    return rel_errors
@@ -0,0 +1,175 @@
+"""
+Hyperparameter grid search for the Lab1 classifiers on a pool of worker
+processes.
+
+The training and validation arrays are copied once into
+multiprocessing.shared_memory blocks; every worker maps the same blocks when it
+starts, so tasks only carry a parameter dictionary instead of a pickled copy
+of the dataset. Example:
+
+results = grid_search(LinearSVM,
+                      {'learning_rate': [1e-7, 5e-7], 'reg': [2.5e4, 5e4],
+                       'num_iters': [1500]},
+                      X_train, y_train, X_val, y_val,
+                      result_file='svm_search.jsonl')
+best = max(results, key=lambda r: r['val_acc'])
+"""
+from __future__ import print_function
+
+import inspect
+import itertools
+import json
+import os
+import time
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+# Arrays of the current search, mapped from shared memory by _init_worker.
+_worker_data = {}
+_worker_blocks = []
+
+
+def _init_worker(specs):
+    """
+    Map the shared memory blocks described by specs, a dictionary mapping
+    array names to (block name, shape, dtype string) tuples.
+    """
+    for key, (name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=name)
+        _worker_blocks.append(block)
+        _worker_data[key] = np.ndarray(shape, dtype=np.dtype(dtype),
+                                       buffer=block.buf)
+
+
+def _split_params(classifier, params):
+    """
+    Split params into keyword arguments for classifier.train and
+    classifier.predict, by parameter name.
+    """
+    train_names = inspect.signature(classifier.train).parameters
+    predict_names = inspect.signature(classifier.predict).parameters
+    train_kwargs, predict_kwargs = {}, {}
+    for name, value in params.items():
+        if name in train_names:
+            train_kwargs[name] = value
+        elif name in predict_names:
+            predict_kwargs[name] = value
+        else:
+            raise ValueError('Parameter "%s" is accepted by neither train nor '
+                             'predict' % name)
+    return train_kwargs, predict_kwargs
+
+
+def _run_config(task):
+    """
+    Train and evaluate one configuration on the shared data of this worker.
+    """
+    factory, params = task
+    tic = time.time()
+    classifier = factory()
+    train_kwargs, predict_kwargs = _split_params(classifier, params)
+    classifier.train(_worker_data['X_train'], _worker_data['y_train'],
+                     **train_kwargs)
+    y_pred = classifier.predict(_worker_data['X_val'], **predict_kwargs)
+    val_acc = float(np.mean(y_pred == _worker_data['y_val']))
+    return {'params': params, 'val_acc': val_acc, 'time': time.time() - tic}
+
+
+def _params_key(params):
+    return json.dumps(params, sort_keys=True)
+
+
+def _expand_grid(param_grid):
+    """
+    All combinations of the values in param_grid, as a list of dictionaries of
+    plain Python values (so that they can be written to JSON).
+    """
+    names = sorted(param_grid)
+    configs = []
+    for values in itertools.product(*(param_grid[name] for name in names)):
+        values = [v.item() if isinstance(v, np.generic) else v for v in values]
+        configs.append(dict(zip(names, values)))
+    return configs
+
+
+def grid_search(factory, param_grid, X_train, y_train, X_val, y_val,
+                num_workers=None, result_file=None, verbose=True):
+    """
+    Evaluate a classifier on every combination of a parameter grid, spreading
+    the configurations over a pool of processes that share one copy of the
+    data.
+
+    Inputs:
+    - factory: A picklable callable, such as a classifier class, that returns a
+      new untrained classifier with train(X, y, ...) and predict(X, ...)
+      methods.
+    - param_grid: A dictionary mapping parameter names to lists of values. Each
+      parameter is passed by name to whichever of train and predict accepts it
+      (train first), e.g. learning_rate and reg for LinearSVM, or k for
+      KNearestNeighbor.
+    - X_train, y_train: Training data and labels.
+    - X_val, y_val: Validation data and labels.
+    - num_workers: Number of worker processes; defaults to the number of CPUs.
+    - result_file: Optional path of a JSON lines file. Every finished
+      configuration is appended to it as soon as it completes, and
+      configurations already present in it are not run again, so an
+      interrupted search resumes where it stopped.
+    - verbose: If True, print each result as it arrives.
+
+    Returns:
+    - results: A list of dictionaries with keys 'params', 'val_acc' and 'time'
+      (seconds spent training and predicting), one per configuration,
+      including those read back from result_file.
+    """
+    configs = _expand_grid(param_grid)
+    # Fail early, in this process, on parameters that nothing accepts.
+    for params in configs[:1]:
+        _split_params(factory(), params)
+
+    results = []
+    if result_file is not None and os.path.exists(result_file):
+        with open(result_file) as f:
+            results = [json.loads(line) for line in f if line.strip()]
+    done = set(_params_key(r['params']) for r in results)
+    todo = [params for params in configs if _params_key(params) not in done]
+    if verbose and results:
+        print('resuming: %d of %d configurations already done'
+              % (len(configs) - len(todo), len(configs)))
+    if not todo:
+        return results
+
+    arrays = {'X_train': X_train, 'y_train': y_train,
+              'X_val': X_val, 'y_val': y_val}
+    blocks, specs = [], {}
+    try:
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True,
+                                               size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            specs[key] = (block.name, array.shape, array.dtype.str)
+
+        out = open(result_file, 'a') if result_file is not None else None
+        try:
+            with Pool(num_workers or os.cpu_count() or 1,
+                      initializer=_init_worker, initargs=(specs,)) as pool:
+                tasks = [(factory, params) for params in todo]
+                for result in pool.imap_unordered(_run_config, tasks):
+                    results.append(result)
+                    if out is not None:
+                        out.write(json.dumps(result) + '\n')
+                        out.flush()
+                    if verbose:
+                        print('%s val_acc %f (%.1fs)'
+                              % (_params_key(result['params']),
+                                 result['val_acc'], result['time']))
+        finally:
+            if out is not None:
+                out.close()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return results
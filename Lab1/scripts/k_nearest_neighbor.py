@@ -1,29 +1,466 @@
 from builtins import range
 from builtins import object
+import os
+
 import numpy as np
-from collections import Counter
+
+from .parallel import for_each_tile, num_jobs
+
+# Default cap, in bytes, on the temporaries of one tile of the tiled distance
+# computation.
+DEFAULT_MEMORY_BUDGET = 256 * 1024 ** 2
+
+# Distance metrics understood by KNearestNeighbor; see _distance_block.
+METRICS = ('l2', 'sqeuclidean', 'l1', 'cosine')
+
+
+def _squared_norms(X, batch_size=1024):
+    """
+    Squared L2 norm of every row of X, computed in float64 a batch of rows at
+    a time so that a low-precision X is never upcast as a whole.
+    """
+    sq_norms = np.empty(X.shape[0])
+    for i in range(0, X.shape[0], batch_size):
+        X_batch = np.asarray(X[i:i + batch_size], dtype=np.float64)
+        sq_norms[i:i + batch_size] = np.einsum('ij,ij->i', X_batch, X_batch)
+    return sq_norms
+
+
+def _tile_sizes(num_test, num_train, dim, memory_budget, metric='l2'):
+    """
+    Choose the number of test rows and training rows processed per tile so that
+    the float64 temporaries of one tile - a (test_tile, train_tile) block of
+    distances plus both input tiles, or for 'l1' the (test_tile, train_tile, D)
+    broadcast difference - fit in memory_budget bytes.
+    """
+    budget = max(int(memory_budget) // 8, 1)
+    if metric == 'l1':
+        side = int(np.sqrt(budget // dim))
+        test_tile = int(min(num_test, max(side, 1)))
+        train_tile = int(min(num_train, max(budget // (test_tile * dim), 1)))
+        return test_tile, train_tile
+    side = int(np.sqrt(dim * dim + budget)) - dim
+    test_tile = int(min(num_test, max(side, 1)))
+    train_tile = (budget - test_tile * dim) // (test_tile + dim)
+    train_tile = int(min(num_train, max(train_tile, 1)))
+    return test_tile, train_tile
+
+
+def _parallel_tile_sizes(num_test, num_train, dim, memory_budget, n_jobs,
+                         metric='l2'):
+    """
+    Like _tile_sizes, but split memory_budget between n_jobs concurrent tiles
+    and make sure there are at least n_jobs test tiles to hand out.
+    """
+    test_tile, train_tile = _tile_sizes(num_test, num_train, dim,
+                                        memory_budget // n_jobs, metric)
+    test_tile = min(test_tile, max(-(-num_test // n_jobs), 1))
+    return test_tile, train_tile
+
+
+def _distance_block(metric, X_tile, T_tile, x_sq_norms, t_sq_norms, out):
+    """
+    Ranking distances between the rows of X_tile and the rows of T_tile,
+    written into out. Ranking distances order neighbors exactly like the
+    metric itself but skip the work that does not change the order:
+
+    - 'l2' and 'sqeuclidean': squared L2 distance, from the GEMM expansion
+      ||x||^2 + ||t||^2 - 2 x.t.
+    - 'cosine': 1 - cos(x, t), from the same GEMM scaled by the norms.
+    - 'l1': sum of absolute differences, from a blocked broadcast.
+
+    Inputs:
+    - metric: One of METRICS.
+    - X_tile: A float64 array of shape (m, D).
+    - T_tile: A float64 array of shape (n, D).
+    - x_sq_norms, t_sq_norms: Squared L2 norms of the rows of X_tile and T_tile,
+      of shapes (m,) and (n,); unused for 'l1'.
+    - out: A float64 array of shape (m, n).
+    """
+    if metric == 'l1':
+        diffs = X_tile[:, np.newaxis, :] - T_tile[np.newaxis, :, :]
+        np.abs(diffs, out=diffs)
+        np.sum(diffs, axis=2, out=out)
+        return out
+    np.matmul(X_tile, T_tile.T, out=out)
+    if metric == 'cosine':
+        out /= np.sqrt(np.maximum(x_sq_norms, 1e-24))[:, np.newaxis]
+        out /= np.sqrt(np.maximum(t_sq_norms, 1e-24))
+        np.subtract(1, out, out=out)
+    else:
+        out *= -2
+        out += x_sq_norms[:, np.newaxis]
+        out += t_sq_norms
+    # Rounding can push distances of (near) duplicates below zero.
+    np.maximum(out, 0, out=out)
+    return out
+
+
+def _finish_distances(metric, dists):
+    """
+    Turn ranking distances from _distance_block into distances of the metric,
+    in place: only 'l2' needs a square root.
+    """
+    if metric == 'l2':
+        np.sqrt(dists, out=dists)
+    return dists
+
+
+def _paired_distances(metric, X_batch, T_rows):
+    """
+    Ranking distances, as defined by _distance_block, between each row of
+    X_batch and its own set of gathered rows.
+
+    Inputs:
+    - metric: One of METRICS.
+    - X_batch: A float64 array of shape (m, D).
+    - T_rows: A float64 array of shape (m, c, D); it is overwritten.
+
+    Returns:
+    - dists: A numpy array of shape (m, c).
+    """
+    if metric == 'cosine':
+        dots = np.einsum('ijk,ik->ij', T_rows, X_batch)
+        norms = np.sqrt(np.einsum('ijk,ijk->ij', T_rows, T_rows))
+        norms *= np.linalg.norm(X_batch, axis=1)[:, np.newaxis]
+        return np.maximum(1 - dots / np.maximum(norms, 1e-24), 0)
+    T_rows -= X_batch[:, np.newaxis, :]
+    if metric == 'l1':
+        return np.sum(np.abs(T_rows, out=T_rows), axis=2)
+    return np.einsum('ijk,ijk->ij', T_rows, T_rows)
+
+
+def _check_k(k, num_train):
+    """
+    Raise ValueError unless 1 <= k <= num_train.
+    """
+    if not 1 <= k <= num_train:
+        raise ValueError('Invalid value %d for k with %d training points'
+                         % (k, num_train))
+
+
+def _sorted_neighbors(dists, k):
+    """
+    Indices of the k smallest entries of every row of dists, nearest first.
+    """
+    neighbors = np.argpartition(dists, k - 1, axis=1)[:, :k]
+    order = np.argsort(np.take_along_axis(dists, neighbors, axis=1), axis=1,
+                       kind='stable')
+    return np.take_along_axis(neighbors, order, axis=1)
+
+
+def _vote_multi_k(closest_y, k_values, num_classes):
+    """
+    Majority votes for several values of k from the labels of each test point's
+    neighbors sorted by increasing distance. Per-class vote counts are
+    accumulated one neighbor rank at a time and read out at every k in k_values.
+
+    Inputs:
+    - closest_y: A numpy array of shape (num_test, k_max) of neighbor labels,
+      nearest first, with k_max >= max(k_values).
+    - k_values: A list of the numbers of neighbors to evaluate.
+    - num_classes: Number of classes C; labels lie in 0...C-1.
+
+    Returns:
+    - y_preds: A dictionary mapping each k in k_values to the predicted labels,
+      with ties broken in favour of the smaller label.
+    """
+    for k in k_values:
+        _check_k(k, closest_y.shape[1])
+    num_test = closest_y.shape[0]
+    rows = np.arange(num_test)
+    votes = np.zeros((num_test, num_classes), dtype=np.intp)
+    wanted = set(k_values)
+    y_preds = {}
+    for k in range(1, max(k_values) + 1):
+        votes[rows, closest_y[:, k - 1]] += 1
+        if k in wanted:
+            y_preds[k] = np.argmax(votes, axis=1)
+    return {k: y_preds[k] for k in k_values}
+
+
+def pairwise_distances(X, metric='l2', memory_budget=DEFAULT_MEMORY_BUDGET,
+                       rank_only=False):
+    """
+    Distances between all pairs of rows of X.
+
+    The matrix is symmetric, so only tiles on or above the diagonal are
+    computed, with the kernels of _distance_block; each tile is mirrored into
+    the lower triangle.
+
+    Inputs:
+    - X: A numpy array of shape (N, D).
+    - metric: One of METRICS.
+    - memory_budget: Upper bound, in bytes, on the temporaries of one tile.
+    - rank_only: If True, return ranking distances (squared distances for 'l2'),
+      which is all that neighbor search needs.
+
+    Returns:
+    - dists: A numpy array of shape (N, N).
+    """
+    num_rows = X.shape[0]
+    sq_norms = _squared_norms(X)
+    dists = np.empty((num_rows, num_rows))
+    tile, _ = _tile_sizes(num_rows, num_rows, X.shape[1], memory_budget // 2,
+                          metric)
+    block = np.empty((tile, tile))
+    for i in range(0, num_rows, tile):
+        X_tile = np.asarray(X[i:i + tile], dtype=np.float64)
+        for j in range(i, num_rows, tile):
+            T_tile = np.asarray(X[j:j + tile], dtype=np.float64)
+            out = block[:X_tile.shape[0], :T_tile.shape[0]]
+            _distance_block(metric, X_tile, T_tile, sq_norms[i:i + tile],
+                            sq_norms[j:j + tile], out)
+            dists[i:i + tile, j:j + tile] = out
+            dists[j:j + tile, i:i + tile] = out.T
+    if not rank_only:
+        _finish_distances(metric, dists)
+    return dists
+
+
+def cross_validate(X, y, k_values, num_folds=5, metric='l2',
+                   memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    num_folds-fold cross-validation of a kNN classifier for every k in
+    k_values.
+
+    Every fold's (validation, training) distance matrix is a block of the
+    distances between all rows of X, so those are computed once with
+    pairwise_distances. Each fold then masks out its own columns and
+    answers all values of k from a single sort with _vote_multi_k. The folds
+    are the contiguous splits produced by np.array_split.
+
+    Inputs:
+    - X: A numpy array of shape (N, D) containing the training data.
+    - y: A numpy array of shape (N,) containing the training labels.
+    - k_values: A list of the numbers of neighbors to evaluate.
+    - num_folds: Number of folds.
+    - metric: One of METRICS.
+    - memory_budget: Upper bound, in bytes, on the temporaries of one tile of
+      the distance computation.
+
+    Returns:
+    - k_to_accuracies: A dictionary mapping each k in k_values to a list of
+      num_folds validation accuracies, one per fold.
+    """
+    num_classes = int(np.max(y)) + 1
+    k_max = max(k_values)
+    # Every fold trains on at least the points outside the largest fold.
+    for k in k_values:
+        _check_k(k, X.shape[0] - -(-X.shape[0] // num_folds))
+    dists = pairwise_distances(X, metric=metric, memory_budget=memory_budget,
+                               rank_only=True)
+    k_to_accuracies = {k: [] for k in k_values}
+    for fold in np.array_split(np.arange(X.shape[0]), num_folds):
+        start, stop = fold[0], fold[-1] + 1
+        fold_dists = dists[start:stop].copy()
+        fold_dists[:, start:stop] = np.inf
+        neighbors = _sorted_neighbors(fold_dists, k_max)
+        y_preds = _vote_multi_k(y[neighbors], k_values, num_classes)
+        for k in k_values:
+            k_to_accuracies[k].append(np.mean(y_preds[k] == y[start:stop]))
+    return k_to_accuracies
+
+
+def _fit_projection(X, projection, n_components, batch_size=1024):
+    """
+    Fit a linear map x -> (x - mean) @ components down to n_components
+    dimensions.
+
+    Inputs:
+    - X: A numpy array of shape (N, D).
+    - projection: 'pca' for the top principal components of X, accumulated
+      from the covariance one batch of rows at a time, or 'random' for a
+      Gaussian random projection scaled to preserve distances in expectation.
+    - n_components: Target dimension.
+
+    Returns a tuple of:
+    - mean: A numpy array of shape (D,).
+    - components: A numpy array of shape (D, n_components).
+    """
+    num_rows, dim = X.shape
+    if n_components is None or not 1 <= n_components <= dim:
+        raise ValueError('Invalid value %s for n_components' % n_components)
+    mean = np.zeros(dim)
+    if projection == 'random':
+        components = np.random.randn(dim, n_components) / np.sqrt(n_components)
+        return mean, components
+    if projection != 'pca':
+        raise ValueError('Invalid projection "%s"' % projection)
+    for i in range(0, num_rows, batch_size):
+        mean += np.sum(X[i:i + batch_size], axis=0, dtype=np.float64)
+    mean /= num_rows
+    cov = np.zeros((dim, dim))
+    for i in range(0, num_rows, batch_size):
+        X_batch = np.asarray(X[i:i + batch_size], dtype=np.float64) - mean
+        cov += X_batch.T @ X_batch
+    _, eigvecs = np.linalg.eigh(cov)
+    components = eigvecs[:, ::-1][:, :n_components].copy()
+    return mean, components
+
 
 class KNearestNeighbor(object):
-    """ a kNN classifier with L2 distance """
+    """ a kNN classifier with L2 (or L1 / cosine) distance """
 
-    def __init__(self):
-        pass
+    def __init__(self, metric='l2'):
+        """
+        Inputs:
+        - metric: Distance used by the tiled, streaming and approximate search
+          paths: 'l2' (Euclidean), 'sqeuclidean', 'l1' or 'cosine'. The
+          num_loops implementations always use L2, so predict switches to the
+          tiled path for any other metric.
+        """
+        if metric not in METRICS:
+            raise ValueError('Invalid metric "%s"' % metric)
+        self.metric = metric
 
-    def train(self, X, y):
+    def train(self, X, y, index=None, dtype=None, projection=None,
+              n_components=None):
         """
         Train the classifier. For k-nearest neighbors this is just
-        memorizing the training data.
+        memorizing the training data, optionally in a cheaper form: brute-force
+        search is bound by memory bandwidth, so storing fewer bytes per training
+        point speeds up every query.
 
         Inputs:
         - X: A numpy array of shape (num_train, D) containing the training data
           consisting of num_train samples each of dimension D.
         - y: A numpy array of shape (N,) containing the training labels, where
              y[i] is the label for X[i].
+        - index: Optional approximate nearest neighbor index, such as
+          lsh.RandomHyperplaneLSH, built here over X and used by predict and
+          kneighbors when approximate=True.
+        - dtype: Optional storage dtype for the searched training data, such as
+          np.float32 or np.float16.
+        - projection: Optional dimensionality reduction, 'pca' or 'random' (a
+          Gaussian random projection), fitted once here and applied to every
+          query by transform().
+        - n_components: Target dimension of the projection.
+
+        When dtype or projection is given, the searched data self.X_train is
+        the reduced copy and X itself is kept as self.X_train_exact so that
+        kneighbors can re-rank candidates with exact distances.
         """
+        self.projection_mean = None
+        self.projection_components = None
+        self.X_train_exact = None
+        if projection is not None:
+            self.projection_mean, self.projection_components = _fit_projection(
+                X, projection, n_components)
+        if projection is not None or dtype is not None:
+            self.X_train_exact = X
+            X_search = np.empty((X.shape[0], n_components or X.shape[1]),
+                                dtype=dtype or np.float64)
+            for i in range(0, X.shape[0], 1024):
+                X_search[i:i + 1024] = self.transform(X[i:i + 1024])
+            X = X_search
         self.X_train = X
         self.y_train = y
+        self.X_train_sq_norms = _squared_norms(X)
+        self.num_classes = int(np.max(y)) + 1
+        self.index = index
+        if index is not None:
+            index.build(X)
 
-    def predict(self, X, k=1, num_loops=1):
+    def transform(self, X):
+        """
+        Map points into the space searched by this classifier: the projection
+        fitted by train(), if any, otherwise X is returned unchanged.
+        """
+        if self.projection_components is None:
+            return X
+        X = np.asarray(X, dtype=np.float64) - self.projection_mean
+        return X @ self.projection_components
+
+    def save(self, path, dtype=None):
+        """
+        Write the training store to the directory path as .npy files: the
+        training data (X_train.npy), its labels (y_train.npy) and the squared
+        norms of the training rows (X_train_sq_norms.npy), so that other
+        processes can start answering queries with load(). The metric and a
+        projection fitted by train() are saved too; the exact data used for
+        re-ranking is not.
+
+        Inputs:
+        - path: Directory to write to; it is created if needed.
+        - dtype: Optional compact dtype for the stored training data, such as
+          np.float16, or np.uint8 for raw pixel values. uint8 is only accepted
+          if every value is an integer in [0, 255]. The stored norms are
+          computed from the converted data so that they match what load()
+          returns.
+
+        The data is converted and written batch_size rows at a time into a
+        memory-mapped file, so saving never holds a second full copy of the
+        store in memory.
+        """
+        X = self.X_train
+        batch_size = 1024
+        dtype = X.dtype if dtype is None else np.dtype(dtype)
+        if dtype == np.uint8 and X.dtype != np.uint8:
+            for i in range(0, X.shape[0], batch_size):
+                X_batch = X[i:i + batch_size]
+                if (np.any(X_batch < 0) or np.any(X_batch > 255)
+                        or np.any(X_batch != np.round(X_batch))):
+                    raise ValueError('X_train does not hold uint8 pixel values')
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        stored = np.lib.format.open_memmap(os.path.join(path, 'X_train.npy'),
+                                           mode='w+', dtype=dtype,
+                                           shape=X.shape)
+        for i in range(0, X.shape[0], batch_size):
+            stored[i:i + batch_size] = X[i:i + batch_size]
+        stored.flush()
+        np.save(os.path.join(path, 'y_train.npy'), self.y_train)
+        np.save(os.path.join(path, 'X_train_sq_norms.npy'),
+                _squared_norms(stored, batch_size))
+        del stored
+        np.save(os.path.join(path, 'metric.npy'), np.array(self.metric))
+        if self.projection_components is not None:
+            np.save(os.path.join(path, 'projection_mean.npy'),
+                    self.projection_mean)
+            np.save(os.path.join(path, 'projection_components.npy'),
+                    self.projection_components)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a classifier written by save().
+
+        Inputs:
+        - path: Directory passed to save().
+        - mmap: If True, the arrays are memory-mapped read-only instead of read
+          into memory, so loading takes milliseconds and processes that load the
+          same store share the OS page cache. Distance computations convert the
+          training data to float64 one tile at a time.
+
+        Returns:
+        - classifier: A trained KNearestNeighbor.
+        """
+        mmap_mode = 'r' if mmap else None
+        metric = 'l2'
+        if os.path.exists(os.path.join(path, 'metric.npy')):
+            metric = str(np.load(os.path.join(path, 'metric.npy')))
+        classifier = cls(metric=metric)
+        classifier.X_train = np.load(os.path.join(path, 'X_train.npy'),
+                                     mmap_mode=mmap_mode)
+        classifier.y_train = np.load(os.path.join(path, 'y_train.npy'),
+                                     mmap_mode=mmap_mode)
+        classifier.X_train_sq_norms = np.load(
+            os.path.join(path, 'X_train_sq_norms.npy'), mmap_mode=mmap_mode)
+        classifier.num_classes = int(np.max(classifier.y_train)) + 1
+        classifier.index = None
+        classifier.X_train_exact = None
+        classifier.projection_mean = None
+        classifier.projection_components = None
+        if os.path.exists(os.path.join(path, 'projection_components.npy')):
+            classifier.projection_mean = np.load(
+                os.path.join(path, 'projection_mean.npy'))
+            classifier.projection_components = np.load(
+                os.path.join(path, 'projection_components.npy'))
+        return classifier
+
+    def predict(self, X, k=1, num_loops=1, memory_budget=None, streaming=False,
+                weighted=False, n_jobs=1, approximate=False, rerank=None):
         """
         Predict labels for test data using this classifier.
 
@@ -32,13 +469,47 @@ class KNearestNeighbor(object):
              of num_test samples each of dimension D.
         - k: The number of nearest neighbors that vote for the predicted labels.
         - num_loops: Determines which implementation to use to compute distances
-          between training points and testing points.
+          between training points and testing points. Only used with the 'l2'
+          metric.
+        - memory_budget: If not None, num_loops is ignored and distances are
+          computed with compute_distances_tiled, keeping the temporaries of
+          each tile under this many bytes.
+        - streaming: If True, num_loops is ignored and the k nearest neighbors
+          are found with kneighbors, which never materializes the full
+          (num_test, num_train) distance matrix.
+        - weighted: If True, neighbors vote with weight 1 / distance.
+        - n_jobs: Number of threads that share the test tiles; a negative value
+          uses one thread per CPU. Any value other than 1 implies the tiled
+          distance computation (with DEFAULT_MEMORY_BUDGET unless memory_budget
+          is given) when streaming is False.
+        - approximate: If True, neighbors are searched only among the candidates
+          returned by the index passed to train(); see kneighbors.
+        - rerank: If not None, re-rank this many candidates with exact distances;
+          see kneighbors.
 
         Returns:
         - y: A numpy array of shape (num_test,) containing predicted labels for the
           test data, where y[i] is the predicted label for the test point X[i].
         """
-        if num_loops == 0:
+        use_kneighbors = streaming or approximate or rerank is not None
+        use_tiled = num_jobs(n_jobs) != 1 or self.metric != 'l2'
+        if memory_budget is None and (use_kneighbors or use_tiled):
+            memory_budget = DEFAULT_MEMORY_BUDGET
+        if use_kneighbors:
+            dists, neighbors = self.kneighbors(X, k=k,
+                                               memory_budget=memory_budget,
+                                               n_jobs=n_jobs,
+                                               approximate=approximate,
+                                               rerank=rerank)
+            return self._vote(self.y_train[neighbors],
+                              dists if weighted else None)
+        X = self.transform(X)
+        if memory_budget is not None:
+            # Ranking distances are enough unless the votes are weighted.
+            dists = self.compute_distances_tiled(X, memory_budget=memory_budget,
+                                                 n_jobs=n_jobs,
+                                                 rank_only=not weighted)
+        elif num_loops == 0:
             dists = self.compute_distances_no_loops(X)
         elif num_loops == 1:
             dists = self.compute_distances_one_loop(X)
@@ -47,7 +518,7 @@ class KNearestNeighbor(object):
         else:
             raise ValueError('Invalid value %d for num_loops' % num_loops)
 
-        return self.predict_labels(dists, k=k)
+        return self.predict_labels(dists, k=k, weighted=weighted)
 
     def compute_distances_two_loops(self, X):
         """
@@ -145,7 +616,228 @@ class KNearestNeighbor(object):
         # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
         return dists
 
-    def predict_labels(self, dists, k=1):
+    def compute_distances_tiled(self, X, memory_budget=DEFAULT_MEMORY_BUDGET,
+                                n_jobs=1, rank_only=False):
+        """
+        Compute the distance under self.metric between each test point in X and
+        each training point in self.X_train, one tile of test rows and training
+        rows at a time. L2 and cosine use ||x - t||^2 = ||x||^2 + ||t||^2 - 2 x.t
+        and its normalized form, L1 a blocked broadcast; see _distance_block.
+
+        Unlike compute_distances_no_loops this never builds a
+        (num_train, num_test, D) temporary: the tiles are sized so that the
+        intermediates of one tile fit in memory_budget bytes, however large
+        the data is. The training norms are the ones precomputed by train().
+
+        Inputs:
+        - X: A numpy array of shape (num_test, D) containing test data.
+        - memory_budget: Upper bound, in bytes, on the temporaries of all tiles
+          in flight.
+        - n_jobs: Number of threads that fill test tiles of the shared output
+          concurrently; a negative value uses one thread per CPU.
+        - rank_only: If True, return ranking distances, which order neighbors
+          like the metric but skip the square root of 'l2'.
+
+        Returns: Same as compute_distances_two_loops
+        """
+        num_test = X.shape[0]
+        num_train = self.X_train.shape[0]
+        n_jobs = num_jobs(n_jobs)
+        dists = np.empty((num_test, num_train))
+        test_tile, train_tile = _parallel_tile_sizes(num_test, num_train,
+                                                     X.shape[1], memory_budget,
+                                                     n_jobs, self.metric)
+
+        def fill_tile(i):
+            X_tile = np.asarray(X[i:i + test_tile], dtype=np.float64)
+            for j, block in self._distance_blocks(X_tile, train_tile):
+                dists[i:i + test_tile, j:j + block.shape[1]] = block
+
+        for_each_tile(fill_tile, num_test, test_tile, n_jobs)
+        if not rank_only:
+            _finish_distances(self.metric, dists)
+        return dists
+
+    def kneighbors(self, X, k=1, memory_budget=DEFAULT_MEMORY_BUDGET, n_jobs=1,
+                   approximate=False, rerank=None):
+        """
+        Find the k nearest training points of each test point in X without
+        materializing the (num_test, num_train) distance matrix.
+
+        Distances are computed one training tile at a time; the k best
+        candidates of each tile are merged into a running (num_test_tile, k)
+        buffer of the best neighbors seen so far, so memory beyond the tile
+        temporaries is O(num_test * k).
+
+        Inputs:
+        - X: A numpy array of shape (num_test, D) containing test data.
+        - k: The number of neighbors to return for each test point.
+        - memory_budget: Upper bound, in bytes, on the temporaries of all tiles
+          in flight.
+        - n_jobs: Number of threads that process test tiles concurrently; a
+          negative value uses one thread per CPU.
+        - approximate: If True, only the candidates returned by the index passed
+          to train() are scanned for each test point (all training points if
+          the index finds fewer than k). memory_budget and n_jobs are ignored.
+        - rerank: If not None and train() stored a reduced copy of the data, the
+          max(rerank, k) nearest candidates in the reduced space are re-ranked
+          with exact distances on self.X_train_exact and the k best are kept.
+
+        X is mapped with transform() before searching, and the returned
+        distances are measured in the searched space unless rerank is used.
+
+        Returns a tuple of:
+        - dists: A numpy array of shape (num_test, k) giving the distances to the
+          neighbors, sorted in increasing order along each row.
+        - neighbors: A numpy array of shape (num_test, k) giving the indices into
+          self.X_train of the corresponding neighbors.
+        """
+        num_test = X.shape[0]
+        num_train = self.X_train.shape[0]
+        _check_k(k, num_train)
+        if rerank is not None and self.X_train_exact is not None:
+            num_candidates = min(max(rerank, k), num_train)
+            _, candidates = self.kneighbors(X, k=num_candidates,
+                                            memory_budget=memory_budget,
+                                            n_jobs=n_jobs,
+                                            approximate=approximate)
+            return self._rerank(X, candidates, k, memory_budget)
+        X = self.transform(X)
+        if approximate:
+            return self._approximate_kneighbors(X, k)
+        n_jobs = num_jobs(n_jobs)
+        dists = np.empty((num_test, k))
+        neighbors = np.empty((num_test, k), dtype=np.intp)
+        test_tile, train_tile = _parallel_tile_sizes(num_test, num_train,
+                                                     X.shape[1], memory_budget,
+                                                     n_jobs, self.metric)
+
+        def search_tile(i):
+            X_tile = np.asarray(X[i:i + test_tile], dtype=np.float64)
+            best_dists = np.full((X_tile.shape[0], k), np.inf)
+            best_idx = np.zeros((X_tile.shape[0], k), dtype=np.intp)
+            for j, block in self._distance_blocks(X_tile, train_tile):
+                # Shortlist the k best columns of this tile before merging.
+                if block.shape[1] > k:
+                    idx = np.argpartition(block, k - 1, axis=1)[:, :k]
+                else:
+                    idx = np.broadcast_to(np.arange(block.shape[1]), block.shape)
+                cand_dists = np.concatenate(
+                    [best_dists, np.take_along_axis(block, idx, axis=1)], axis=1)
+                cand_idx = np.concatenate([best_idx, idx + j], axis=1)
+                keep = np.argpartition(cand_dists, k - 1, axis=1)[:, :k]
+                best_dists = np.take_along_axis(cand_dists, keep, axis=1)
+                best_idx = np.take_along_axis(cand_idx, keep, axis=1)
+            order = np.argsort(best_dists, axis=1, kind='stable')
+            dists[i:i + test_tile] = np.take_along_axis(best_dists, order, axis=1)
+            neighbors[i:i + test_tile] = np.take_along_axis(best_idx, order, axis=1)
+
+        for_each_tile(search_tile, num_test, test_tile, n_jobs)
+        return _finish_distances(self.metric, dists), neighbors
+
+    def _rerank(self, X, candidates, k, memory_budget):
+        """
+        Keep the k of the candidate neighbors of each row of X that are nearest
+        under exact self.metric distances on self.X_train_exact.
+
+        Inputs:
+        - X: A numpy array of shape (num_test, D) of untransformed test data.
+        - candidates: A numpy array of shape (num_test, num_candidates) of
+          indices into the training data.
+        - k: Number of neighbors to keep.
+        - memory_budget: Upper bound, in bytes, on the gathered candidate rows.
+
+        Returns: Same as kneighbors.
+        """
+        num_test, num_candidates = candidates.shape
+        dim = self.X_train_exact.shape[1]
+        batch_size = max(int(memory_budget) // (8 * num_candidates * dim), 1)
+        dists = np.empty((num_test, k))
+        neighbors = np.empty((num_test, k), dtype=np.intp)
+        for i in range(0, num_test, batch_size):
+            X_batch = np.asarray(X[i:i + batch_size], dtype=np.float64)
+            cand = candidates[i:i + batch_size]
+            T_rows = np.asarray(self.X_train_exact[cand.ravel()], dtype=np.float64)
+            T_rows = T_rows.reshape(cand.shape + (dim,))
+            cand_dists = _paired_distances(self.metric, X_batch, T_rows)
+            best = np.argsort(cand_dists, axis=1, kind='stable')[:, :k]
+            dists[i:i + batch_size] = np.take_along_axis(cand_dists, best, axis=1)
+            neighbors[i:i + batch_size] = np.take_along_axis(cand, best, axis=1)
+        return _finish_distances(self.metric, dists), neighbors
+
+    def _approximate_kneighbors(self, X, k, batch_size=1024):
+        """
+        kneighbors restricted to the candidates of self.index; see kneighbors.
+        """
+        if self.index is None:
+            raise ValueError('approximate search needs an index passed to train()')
+        num_test = X.shape[0]
+        num_train = self.X_train.shape[0]
+        dists = np.empty((num_test, k))
+        neighbors = np.empty((num_test, k), dtype=np.intp)
+        for start in range(0, num_test, batch_size):
+            X_batch = np.asarray(X[start:start + batch_size], dtype=np.float64)
+            for i, cand in enumerate(self.index.candidates(X_batch)):
+                if cand.shape[0] < k:
+                    cand = np.arange(num_train)
+                x = X_batch[i:i + 1]
+                cand_dists = np.empty((1, cand.shape[0]))
+                _distance_block(self.metric, x, np.asarray(self.X_train[cand],
+                                                           dtype=np.float64),
+                                np.einsum('ij,ij->i', x, x),
+                                self.X_train_sq_norms[cand], cand_dists)
+                cand_dists = cand_dists[0]
+                best = np.argpartition(cand_dists, k - 1)[:k]
+                best = best[np.argsort(cand_dists[best], kind='stable')]
+                dists[start + i] = cand_dists[best]
+                neighbors[start + i] = cand[best]
+        return _finish_distances(self.metric, dists), neighbors
+
+    def iter_predict(self, X, k=1, batch_size=1000,
+                     memory_budget=DEFAULT_MEMORY_BUDGET, weighted=False,
+                     n_jobs=1, rerank=None):
+        """
+        Predict labels for X one batch of test points at a time, so that very
+        large query sets can be served incrementally.
+
+        Inputs:
+        - X: A numpy array (or np.memmap) of shape (num_test, D).
+        - k: The number of nearest neighbors that vote for the predicted labels.
+        - batch_size: Number of test points per yielded batch.
+        - memory_budget: Upper bound, in bytes, on the temporaries of one tile.
+        - weighted: If True, neighbors vote with weight 1 / distance.
+        - n_jobs: Number of threads used for the neighbor search of each batch.
+        - rerank: Number of candidates re-ranked exactly; see kneighbors.
+
+        Yields (start, y_pred) pairs where y_pred holds the predicted labels of
+        X[start:start + batch_size].
+        """
+        for start in range(0, X.shape[0], batch_size):
+            dists, neighbors = self.kneighbors(X[start:start + batch_size], k=k,
+                                               memory_budget=memory_budget,
+                                               n_jobs=n_jobs, rerank=rerank)
+            yield start, self._vote(self.y_train[neighbors],
+                                    dists if weighted else None)
+
+    def _distance_blocks(self, X_tile, train_tile):
+        """
+        Yield (j, block) pairs where block holds the ranking distances (see
+        _distance_block) between the rows of X_tile and
+        self.X_train[j:j + train_tile]. The block is a view into a buffer that
+        is reused for the next tile, so callers must consume it before
+        advancing the generator.
+        """
+        num_train = self.X_train.shape[0]
+        test_sq_norms = np.einsum('ij,ij->i', X_tile, X_tile)
+        buf = np.empty((X_tile.shape[0], min(train_tile, num_train)))
+        for j in range(0, num_train, train_tile):
+            T_tile = np.asarray(self.X_train[j:j + train_tile], dtype=np.float64)
+            block = buf[:, :T_tile.shape[0]]
+            _distance_block(self.metric, X_tile, T_tile, test_sq_norms,
+                            self.X_train_sq_norms[j:j + train_tile], block)
+            yield j, block
+
+    def predict_labels(self, dists, k=1, weighted=False):
         """
         Given a matrix of distances between test points and training points,
         predict a label for each test point.
@@ -153,40 +845,111 @@ class KNearestNeighbor(object):
         Inputs:
         - dists: A numpy array of shape (num_test, num_train) where dists[i, j]
           gives the distance betwen the ith test point and the jth training point.
+        - k: The number of nearest neighbors that vote for the predicted labels.
+        - weighted: If True, each neighbor votes with weight 1 / distance instead
+          of 1.
 
         Returns:
         - y: A numpy array of shape (num_test,) containing predicted labels for the
           test data, where y[i] is the predicted label for the test point X[i].
         """
-        num_test = dists.shape[0]
-        y_pred = np.zeros(num_test)
-        for i in range(num_test):
-            # A list of length k storing the labels of the k nearest neighbors to
-            # the ith test point.
-            closest_y = []
-            #########################################################################
-            # TODO:                                                                 #
-            # Use the distance matrix to find the k nearest neighbors of the ith    #
-            # testing point, and use self.y_train to find the labels of these       #
-            # neighbors. Store these labels in closest_y.                           #
-            # Hint: Look up the function numpy.argsort.                             #
-            #########################################################################
-            # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
+        # A (num_test, k) array storing the labels of the k nearest neighbors of
+        # every test point.
+        closest_y = None
+        #########################################################################
+        # TODO:                                                                 #
+        # Use the distance matrix to find the k nearest neighbors of the ith    #
+        # testing point, and use self.y_train to find the labels of these       #
+        # neighbors. Store these labels in closest_y.                           #
+        # Hint: Look up the function numpy.argsort.                             #
+        #########################################################################
+        # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
-            min_indices = np.argpartition(dists[i, :], k)[:k]  #выбираем минимальные значения
-            closest_y = self.y_train[min_indices]
+        _check_k(k, dists.shape[1])
+        min_indices = np.argpartition(dists, k - 1, axis=1)[:, :k]  #выбираем минимальные значения
+        closest_y = self.y_train[min_indices]
 
-            # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
-            #########################################################################
-            # TODO:                                                                 #
-            # Now that you have found the labels of the k nearest neighbors, you    #
-            # need to find the most common label in the list closest_y of labels.   #
-            # Store this label in y_pred[i]. Break ties by choosing the smaller     #
-            # label.                                                                #
-            #########################################################################
-            # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
-            counter = Counter(closest_y)
-            y_pred[i] = counter.most_common(1)[0][0]
-            # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
+        # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
+        #########################################################################
+        # TODO:                                                                 #
+        # Now that you have found the labels of the k nearest neighbors, you    #
+        # need to find the most common label in the list closest_y of labels.   #
+        # Store this label in y_pred[i]. Break ties by choosing the smaller     #
+        # label.                                                                #
+        #########################################################################
+        # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
+        closest_dists = None
+        if weighted:
+            closest_dists = np.take_along_axis(dists, min_indices, axis=1)
+        y_pred = self._vote(closest_y, closest_dists)
+        # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
+
+        return y_pred
+
+    def predict_labels_multi_k(self, dists, k_values):
+        """
+        Predict labels for every k in k_values from a single sort of each test
+        point's neighbors.
+
+        The nearest max(k_values) neighbors are partitioned out and sorted once;
+        predictions for all k then come from running per-class vote counts, so
+        a sweep over k costs about as much as one call to predict_labels.
 
-        return y_pred
\ No newline at end of file
+        Inputs:
+        - dists: A numpy array of shape (num_test, num_train), as for
+          predict_labels.
+        - k_values: A list of the numbers of neighbors to evaluate.
+
+        Returns:
+        - y_preds: A dictionary mapping each k in k_values to a numpy array of
+          shape (num_test,) containing the labels predicted with k neighbors.
+        """
+        for k in k_values:
+            _check_k(k, dists.shape[1])
+        neighbors = _sorted_neighbors(dists, max(k_values))
+        return _vote_multi_k(self.y_train[neighbors], k_values, self.num_classes)
+
+    def accuracy_multi_k(self, dists, y, k_values):
+        """
+        Accuracy of the classifier for every k in k_values, computed with
+        predict_labels_multi_k.
+
+        Inputs:
+        - dists: A numpy array of shape (num_test, num_train), as for
+          predict_labels.
+        - y: A numpy array of shape (num_test,) giving the true test labels.
+        - k_values: A list of the numbers of neighbors to evaluate.
+
+        Returns:
+        - accuracies: A dictionary mapping each k in k_values to the fraction of
+          test points classified correctly with k neighbors.
+        """
+        y_preds = self.predict_labels_multi_k(dists, k_values)
+        return {k: np.mean(y_pred == y) for k, y_pred in y_preds.items()}
+
+    def _vote(self, closest_y, closest_dists=None):
+        """
+        Vote over the labels of the nearest neighbors of every test point at
+        once. Votes are counted with a single bincount over labels offset by
+        row, and argmax breaks ties in favour of the smaller label.
+
+        Inputs:
+        - closest_y: A numpy array of shape (num_test, k) giving the labels of
+          the k nearest neighbors of each test point.
+        - closest_dists: If not None, a numpy array of the same shape giving the
+          distances to those neighbors; each neighbor then votes with weight
+          1 / distance.
+
+        Returns:
+        - y: A numpy array of shape (num_test,) containing predicted labels.
+        """
+        num_test = closest_y.shape[0]
+        num_classes = self.num_classes
+        offset_y = closest_y + num_classes * np.arange(num_test)[:, np.newaxis]
+        weights = None
+        if closest_dists is not None:
+            weights = 1.0 / (closest_dists + 1e-12)
+            weights = weights.ravel()
+        votes = np.bincount(offset_y.ravel(), weights=weights,
+                            minlength=num_test * num_classes)
+        return np.argmax(votes.reshape(num_test, num_classes), axis=1)
@@ -4,22 +4,104 @@ from builtins import range
 from builtins import object
 import numpy as np
 from .linear_svm import *
+from .parallel import for_each_tile, num_jobs
+from .softmax import *
+from .sparse import issparse
 
 
+class EpochSampler(object):
+    """
+    Serves minibatches that visit every training example exactly once per
+    epoch, instead of sampling indices with replacement at every step.
+
+    With shuffle='rows' the examples are permuted once per epoch and each
+    minibatch is gathered with np.take into one preallocated batch buffer.
+    With shuffle='blocks' the data is cut into contiguous blocks of batch_size
+    rows and only the order of the blocks is permuted, so minibatches are
+    served as slices of X with no copy at all; this assumes X was shuffled once
+    beforehand, as the CIFAR-10 loaders do. Sparse X (see sparse.py) has no
+    fixed-size batch buffer, so with shuffle='rows' its minibatches are
+    gathered into new matrices.
+    """
+
+    def __init__(self, X, y, batch_size, shuffle='rows'):
+        """
+        Inputs:
+        - X: A numpy array of shape (N, D) containing training data.
+        - y: A numpy array of shape (N,) containing training labels.
+        - batch_size: Number of examples per minibatch; the last minibatch of an
+          epoch is smaller when batch_size does not divide N.
+        - shuffle: 'rows' or 'blocks', see above.
+        """
+        if shuffle not in ('rows', 'blocks'):
+            raise ValueError('Invalid shuffle "%s"' % shuffle)
+        self.X = X
+        self.y = y
+        self.batch_size = min(batch_size, X.shape[0])
+        self.shuffle = shuffle
+        self.epoch = 0
+        self._starts = np.arange(0, X.shape[0], self.batch_size)
+        self._pos = len(self._starts)
+        if shuffle == 'rows' and not issparse(X):
+            self._X_batch = np.empty((self.batch_size,) + X.shape[1:],
+                                     dtype=X.dtype)
+            self._y_batch = np.empty(self.batch_size, dtype=y.dtype)
+
+    def next_batch(self):
+        """
+        Return the next minibatch (X_batch, y_batch), starting a new epoch when
+        the current one is exhausted. With shuffle='rows' the arrays are views of
+        buffers that the next call overwrites.
+        """
+        if self._pos == len(self._starts):
+            if self.shuffle == 'rows':
+                self._order = np.random.permutation(self.X.shape[0])
+            else:
+                np.random.shuffle(self._starts)
+            self._pos = 0
+            self.epoch += 1
+        if self.shuffle == 'rows' and issparse(self.X):
+            start = self._pos * self.batch_size
+            indices = self._order[start:start + self.batch_size]
+            X_batch, y_batch = self.X[indices], self.y[indices]
+        elif self.shuffle == 'rows':
+            start = self._pos * self.batch_size
+            indices = self._order[start:start + self.batch_size]
+            n = indices.shape[0]
+            # The indices come from a permutation, so mode='clip' is safe; it
+            # lets np.take write straight into out instead of into a temporary.
+            X_batch = np.take(self.X, indices, axis=0, out=self._X_batch[:n],
+                              mode='clip')
+            y_batch = np.take(self.y, indices, out=self._y_batch[:n], mode='clip')
+        else:
+            start = self._starts[self._pos]
+            X_batch = self.X[start:start + self.batch_size]
+            y_batch = self.y[start:start + self.batch_size]
+        self._pos += 1
+        return X_batch, y_batch
+
 
 class LinearClassifier(object):
 
     def __init__(self):
         self.W = None
+        self.W_many = None
+        self._workspaces = {}
 
     def train(self, X, y, learning_rate=1e-3, reg=1e-5, num_iters=100,
-              batch_size=200, verbose=False):
+              batch_size=200, verbose=False, sampler='random', method='sgd',
+              tol=1e-5, chunk_size=10000, history_size=10, patience=None,
+              check_every=100, X_val=None, y_val=None, min_delta=1e-3,
+              smoothing=0.99):
         """
-        Train this linear classifier using stochastic gradient descent.
+        Train this linear classifier using stochastic gradient descent, or with
+        full-batch L-BFGS.
 
         Inputs:
         - X: A numpy array of shape (N, D) containing training data; there are N
-          training samples each of dimension D.
+          training samples each of dimension D. It may also be a sparse CSR
+          matrix (a sparse.CSRMatrix or a scipy.sparse one), for example from
+          sparse.hash_features; the losses then use sparse-dense products.
         - y: A numpy array of shape (N,) containing training labels; y[i] = c
           means that X[i] has label 0 <= c < C for C classes.
         - learning_rate: (float) learning rate for optimization.
@@ -27,18 +109,66 @@ class LinearClassifier(object):
         - num_iters: (integer) number of steps to take when optimizing
         - batch_size: (integer) number of training examples to use at each step.
         - verbose: (boolean) If true, print progress during optimization.
+        - sampler: (string) How minibatches are drawn: 'random' samples
+          batch_size indices with replacement at every step; 'epoch' and
+          'blocks' go through every example once per epoch with an
+          EpochSampler using shuffle='rows' or shuffle='blocks' respectively.
+        - method: (string) 'sgd' for minibatch SGD, or 'lbfgs' for L-BFGS on the
+          full-batch objective (see _train_lbfgs). L-BFGS ignores
+          learning_rate, batch_size and sampler, and num_iters bounds its number
+          of iterations.
+        - tol: (float) L-BFGS stops once an iteration decreases the loss by less
+          than tol relative to its value.
+        - chunk_size: (integer) number of examples per chunk when L-BFGS
+          evaluates the full-batch loss, bounding the memory of each pass.
+        - history_size: (integer) number of curvature pairs kept by L-BFGS.
+        - patience: (integer) If given, SGD stops early once patience
+          consecutive checks, made every check_every iterations, show no
+          improvement. A check compares validation accuracy on X_val, y_val
+          when they are given, and an exponential moving average of the
+          minibatch loss (weight smoothing on the old value) otherwise.
+          With validation data the weights of the best check are restored.
+        - check_every: (integer) number of iterations between checks.
+        - X_val, y_val: Optional validation data and labels for the checks.
+        - min_delta: (float) smallest improvement that counts: absolute for
+          validation accuracy, relative to the best value for the smoothed loss.
+        - smoothing: (float) decay of the moving average of the loss.
 
         Outputs:
-        A list containing the value of the loss function at each training iteration.
+        A numpy array containing the value of the loss function at each training
+        iteration; with early stopping it ends at the last iteration run.
         """
         num_train, dim = X.shape
         num_classes = np.max(y) + 1 # assume y takes values 0...K-1 where K is number of classes
         if self.W is None:
-            # lazily initialize W
-            self.W = 0.001 * np.random.randn(dim, num_classes)
+            # lazily initialize W, in the precision of X when X is floating point
+            dtype = X.dtype if np.issubdtype(X.dtype, np.floating) else np.float64
+            self.W = 0.001 * np.random.randn(dim, num_classes).astype(dtype)
+
+        if method == 'lbfgs':
+            return self._train_lbfgs(X, y, reg, num_iters, tol, chunk_size,
+                                     history_size, verbose)
+        elif method != 'sgd':
+            raise ValueError('Invalid method "%s"' % method)
+
+        if sampler in ('epoch', 'blocks'):
+            epoch_sampler = EpochSampler(X, y, batch_size,
+                                         shuffle='rows' if sampler == 'epoch' else 'blocks')
+        elif sampler != 'random':
+            raise ValueError('Invalid sampler "%s"' % sampler)
+
+        if patience is not None:
+            if check_every < 1:
+                raise ValueError('Invalid value %d for check_every' % check_every)
+            if (X_val is None) != (y_val is None):
+                raise ValueError('X_val and y_val must be given together')
+            best = -np.inf if X_val is not None else np.inf
+            best_W = None
+            bad_checks = 0
+            smoothed_loss = None
 
         # Run stochastic gradient descent to optimize W
-        loss_history = []
+        loss_history = np.empty(num_iters)
         for it in range(num_iters):
             X_batch = None
             y_batch = None
@@ -56,17 +186,20 @@ class LinearClassifier(object):
             #########################################################################
             # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
-            # Генерируем случайные индексы выборки
-            indices = np.random.choice(num_train, batch_size)
+            if sampler == 'random':
+                # Генерируем случайные индексы выборки
+                indices = np.random.choice(num_train, batch_size)
 
-            # Выбираем соответствующие элементы из X и y
-            X_batch, y_batch = X[indices], y[indices]
+                # Выбираем соответствующие элементы из X и y
+                X_batch, y_batch = X[indices], y[indices]
+            else:
+                X_batch, y_batch = epoch_sampler.next_batch()
 
             # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
             # evaluate loss and gradient
-            loss, grad = self.loss(X_batch, y_batch, reg)
-            loss_history.append(loss)
+            loss, grad = self._train_loss(X_batch, y_batch, reg)
+            loss_history[it] = loss
 
             # perform parameter update
             #########################################################################
@@ -82,32 +215,233 @@ class LinearClassifier(object):
             if verbose and it % 100 == 0:
                 print('iteration %d / %d: loss %f' % (it, num_iters, loss))
 
+            if patience is None:
+                continue
+            if smoothed_loss is None:
+                smoothed_loss = loss
+            else:
+                smoothed_loss = smoothing * smoothed_loss + (1 - smoothing) * loss
+            if (it + 1) % check_every != 0:
+                continue
+            if X_val is not None:
+                val_acc = np.mean(self.predict(X_val) == y_val)
+                improved = val_acc > best + min_delta
+                if val_acc > best:
+                    best = val_acc
+                    best_W = self.W.copy()
+            else:
+                # The first check always counts as an improvement.
+                improved = (best == np.inf
+                            or smoothed_loss < best - min_delta * abs(best))
+                best = min(best, smoothed_loss)
+            bad_checks = 0 if improved else bad_checks + 1
+            if bad_checks >= patience:
+                if verbose:
+                    print('stopping early at iteration %d / %d' % (it, num_iters))
+                if best_W is not None:
+                    self.W = best_W
+                return loss_history[:it + 1]
+
+        if patience is not None and best_W is not None:
+            self.W = best_W
+        return loss_history
+
+    def full_loss(self, X, y, reg, chunk_size=10000):
+        """
+        Loss and gradient of the current weights on all of X, evaluated with
+        self.loss one chunk of chunk_size examples at a time so that the
+        intermediates never exceed one chunk.
+
+        Returns: Same as loss.
+        """
+        num_train = X.shape[0]
+        loss = 0.0
+        grad = np.zeros_like(self.W)
+        for start in range(0, num_train, chunk_size):
+            X_chunk = X[start:start + chunk_size]
+            chunk_loss, chunk_grad = self.loss(X_chunk, y[start:start + chunk_size],
+                                               0.0)
+            weight = X_chunk.shape[0] / float(num_train)
+            loss += weight * chunk_loss
+            grad += weight * chunk_grad
+        loss += reg * np.sum(self.W * self.W)
+        grad += 2 * reg * self.W
+        return loss, grad
+
+    def _train_lbfgs(self, X, y, reg, num_iters, tol, chunk_size, history_size,
+                     verbose):
+        """
+        Minimize the full-batch objective with L-BFGS: the two-loop recursion
+        over the last history_size (step, gradient change) pairs gives the
+        search direction and a backtracking line search enforces sufficient
+        decrease. The SVM and softmax objectives are convex, so this converges
+        in tens of passes over the data without a learning rate. Pairs with
+        non-positive curvature, which the kinks of the hinge loss can produce,
+        are skipped.
+
+        Returns a numpy array of the loss after every iteration, starting with
+        the initial loss.
+        """
+        steps, grad_changes, curvatures = [], [], []
+        loss, grad = self.full_loss(X, y, reg, chunk_size)
+        loss_history = np.empty(num_iters + 1)
+        loss_history[0] = loss
+        num_losses = 1
+        for it in range(num_iters):
+            # Two-loop recursion for direction = -H grad.
+            direction = -grad
+            alphas = []
+            for s, g, rho in reversed(list(zip(steps, grad_changes, curvatures))):
+                alpha = rho * np.vdot(s, direction)
+                direction -= alpha * g
+                alphas.append(alpha)
+            if steps:
+                direction *= np.vdot(steps[-1], grad_changes[-1]) / np.vdot(
+                    grad_changes[-1], grad_changes[-1])
+            else:
+                direction /= max(np.linalg.norm(grad), 1e-12)
+            for (s, g, rho), alpha in zip(zip(steps, grad_changes, curvatures),
+                                          reversed(alphas)):
+                beta = rho * np.vdot(g, direction)
+                direction += (alpha - beta) * s
+
+            slope = np.vdot(grad, direction)
+            if slope >= 0:
+                # Not a descent direction: restart from steepest descent.
+                steps, grad_changes, curvatures = [], [], []
+                direction = -grad / max(np.linalg.norm(grad), 1e-12)
+                slope = np.vdot(grad, direction)
+
+            W_old = self.W
+            step = 1.0
+            for _ in range(30):
+                self.W = W_old + step * direction
+                new_loss, new_grad = self.full_loss(X, y, reg, chunk_size)
+                if new_loss <= loss + 1e-4 * step * slope:
+                    break
+                step *= 0.5
+            else:
+                self.W = W_old
+                break
+
+            s = self.W - W_old
+            g = new_grad - grad
+            curvature = np.vdot(s, g)
+            if curvature > 1e-10:
+                steps.append(s)
+                grad_changes.append(g)
+                curvatures.append(1.0 / curvature)
+                if len(steps) > history_size:
+                    del steps[0], grad_changes[0], curvatures[0]
+
+            decrease = loss - new_loss
+            loss, grad = new_loss, new_grad
+            loss_history[num_losses] = loss
+            num_losses += 1
+            if verbose:
+                print('iteration %d / %d: loss %f' % (it, num_iters, loss))
+            if decrease <= tol * max(abs(loss), 1.0):
+                break
+
+        return loss_history[:num_losses]
+
+    def train_many(self, X, y, learning_rates, regs, num_iters=100,
+                   batch_size=200, verbose=False):
+        """
+        Train M linear classifiers at once, one per (learning_rate, reg) pair,
+        on the same sequence of minibatches. The weights are stacked into a
+        (M, D, C) array and every step evaluates all models with loss_many,
+        so a hyperparameter grid costs about one training run of data
+        movement.
+
+        Inputs:
+        - X, y, num_iters, batch_size, verbose: As for train.
+        - learning_rates: A sequence of M learning rates.
+        - regs: A sequence of M regularization strengths.
+
+        Outputs:
+        A numpy array of shape (M, num_iters) whose row m is the loss history of
+        model m. The trained weights are stored in self.W_many, with
+        self.W_many[m] holding the weights of model m.
+        """
+        learning_rates = np.asarray(learning_rates, dtype=np.float64)
+        regs = np.asarray(regs, dtype=np.float64)
+        if learning_rates.shape != regs.shape or learning_rates.ndim != 1:
+            raise ValueError('learning_rates and regs must be sequences of the '
+                             'same length')
+        num_models = learning_rates.shape[0]
+        num_train, dim = X.shape
+        num_classes = np.max(y) + 1
+        if self.W_many is None:
+            dtype = X.dtype if np.issubdtype(X.dtype, np.floating) else np.float64
+            self.W_many = 0.001 * np.random.randn(
+                num_models, dim, num_classes).astype(dtype)
+        step_sizes = learning_rates.astype(self.W_many.dtype)[:, np.newaxis,
+                                                              np.newaxis]
+
+        loss_history = np.empty((num_models, num_iters))
+        for it in range(num_iters):
+            indices = np.random.choice(num_train, batch_size)
+            X_batch, y_batch = X[indices], y[indices]
+
+            loss, grad = self.loss_many(X_batch, y_batch, regs)
+            loss_history[:, it] = loss
+            grad *= step_sizes
+            self.W_many -= grad
+
+            if verbose and it % 100 == 0:
+                print('iteration %d / %d: best loss %f'
+                      % (it, num_iters, np.min(loss)))
+
         return loss_history
 
-    def predict(self, X):
+    def predict_many(self, X):
+        """
+        Predict labels for X with each of the models trained by train_many.
+
+        Returns:
+        - y_pred: A numpy array of shape (M, N) where y_pred[m] holds the labels
+          predicted by model m.
+        """
+        num_models, dim, num_classes = self.W_many.shape
+        W_flat = self.W_many.transpose(1, 0, 2).reshape(dim, -1)
+        scores = (X @ W_flat).reshape(X.shape[0], num_models, num_classes)
+        return np.argmax(scores, axis=2).T
+
+    def predict(self, X, batch_size=10000, n_jobs=1):
         """
         Use the trained weights of this linear classifier to predict labels for
         data points.
 
         Inputs:
         - X: A numpy array of shape (N, D) containing training data; there are N
-          training samples each of dimension D.
+          training samples each of dimension D. It may be an np.memmap; only
+          batch_size rows are read into memory at a time. It may also be a
+          sparse CSR matrix, as in train.
+        - batch_size: (integer) number of rows scored at a time.
+        - n_jobs: (integer) number of threads scoring chunks concurrently; a
+          negative value means one per CPU.
 
         Returns:
         - y_pred: Predicted labels for the data in X. y_pred is a 1-dimensional
           array of length N, and each element is an integer giving the predicted
           class.
         """
-        y_pred = np.zeros(X.shape[0])
+        if batch_size < 1:
+            raise ValueError('Invalid value %d for batch_size' % batch_size)
+        y_pred = np.empty(X.shape[0], dtype=np.intp)
         ###########################################################################
         # TODO:                                                                   #
         # Implement this method. Store the predicted labels in y_pred.            #
         ###########################################################################
         # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
-        scores = X@self.W
-        # Определение индексов классов с наивысшей оценкой для каждого образца
-        y_pred = np.argmax(scores, axis=1)
+        def predict_chunk(start):
+            scores = X[start:start + batch_size] @ self.W
+            # Определение индексов классов с наивысшей оценкой для каждого образца
+            np.argmax(scores, axis=1, out=y_pred[start:start + batch_size])
+
+        for_each_tile(predict_chunk, X.shape[0], batch_size, num_jobs(n_jobs))
 
         # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
         return y_pred
@@ -129,6 +463,29 @@ class LinearClassifier(object):
         """
         pass
 
+    def loss_many(self, X_batch, y_batch, regs):
+        """
+        Compute the loss function and its derivative for the M stacked models of
+        self.W_many. Subclasses will override this to support train_many.
+
+        Inputs:
+        - X_batch, y_batch: As for loss.
+        - regs: A numpy array of shape (M,) of regularization strengths.
+
+        Returns: A tuple containing:
+        - losses as a numpy array of shape (M,)
+        - gradient with respect to self.W_many; an array of shape (M, D, C)
+        """
+        pass
+
+    def _train_loss(self, X_batch, y_batch, reg):
+        """
+        Loss and gradient used by train(). The gradient only has to survive
+        until the parameter update, so subclasses may return a buffer that the
+        next call overwrites. Defaults to self.loss.
+        """
+        return self.loss(X_batch, y_batch, reg)
+
 
 class LinearSVM(LinearClassifier):
     """ A subclass that uses the Multiclass SVM loss function """
@@ -136,3 +493,146 @@ class LinearSVM(LinearClassifier):
     def loss(self, X_batch, y_batch, reg):
         return svm_loss_vectorized(self.W, X_batch, y_batch, reg)
 
+    def loss_many(self, X_batch, y_batch, regs):
+        return svm_loss_batched(self.W_many, X_batch, y_batch, regs)
+
+    def fit(self, X, y, reg=1e-5, max_passes=50, tol=0.1, shrinking=True,
+            verbose=False):
+        """
+        Train with dual coordinate descent instead of SGD: one binary
+        L1-loss SVM per class (one-vs-rest), each minimizing
+
+        reg * ||w_c||^2 + (1 / N) * sum_i max(0, 1 - t_ic * X[i].dot(w_c))
+
+        with t_ic = +1 if y[i] = c and -1 otherwise. This is the dual
+        coordinate descent method of Hsieh et al. (2008) applied to every
+        class at once: examples are visited in shuffled order, the dual
+        variables of example i for all C classes are updated in closed form
+        from the cached squared norm ||X[i]||^2, and W follows with a rank-one
+        update. There is no learning rate to tune and a few passes suffice.
+        Examples whose dual variables sit at a bound for every class and are
+        unlikely to move are shrunk from the active set; the full set is
+        checked once more before declaring convergence.
+
+        Inputs:
+        - X: A numpy array of shape (N, D) containing training data.
+        - y: A numpy array of shape (N,) containing training labels.
+        - reg: (float) regularization strength, on the same scale as in train.
+        - max_passes: (integer) maximum number of passes over the active set.
+        - tol: (float) stop when the spread of the projected gradients, the
+          dual optimality violation, is below tol for every class.
+        - shrinking: (boolean) whether to shrink the active set.
+        - verbose: (boolean) If true, print progress after every pass.
+
+        Outputs:
+        A numpy array containing the one-vs-rest primal objective after every
+        pass. If max_passes run out before the violation falls below tol, fit
+        stops there and, with verbose, says so.
+        """
+        if issparse(X):
+            raise ValueError('fit requires a dense X; use train for sparse data')
+        num_train, dim = X.shape
+        num_classes = np.max(y) + 1
+        dtype = X.dtype if np.issubdtype(X.dtype, np.floating) else np.float64
+        self.W = np.zeros((dim, num_classes), dtype=dtype)
+        # Scaling the objective by 1 / (2 reg) gives the usual
+        # 1/2 ||w||^2 + C sum_i hinge_i form with C = 1 / (2 reg N).
+        upper = 1.0 / (2 * reg * num_train)
+        targets = np.where(y[:, np.newaxis] == np.arange(num_classes), 1.0, -1.0)
+        sq_norms = np.einsum('ij,ij->i', X, X)
+        alpha = np.zeros((num_train, num_classes))
+
+        active = np.arange(num_train)
+        shrink_hi = np.full(num_classes, np.inf)
+        shrink_lo = np.full(num_classes, -np.inf)
+        objective_history = np.empty(max_passes)
+        converged = False
+        for it in range(max_passes):
+            np.random.shuffle(active)
+            keep = np.ones(active.shape[0], dtype=bool)
+            pg_max = np.full(num_classes, -np.inf)
+            pg_min = np.full(num_classes, np.inf)
+            for pos, i in enumerate(active):
+                if sq_norms[i] == 0:
+                    continue
+                t = targets[i]
+                a = alpha[i]
+                grad = t * X[i].dot(self.W) - 1
+                at_lower = a <= 0
+                at_upper = a >= upper
+                if shrinking and np.all((at_lower & (grad > shrink_hi))
+                                        | (at_upper & (grad < shrink_lo))):
+                    keep[pos] = False
+                    continue
+                proj_grad = grad.copy()
+                proj_grad[at_lower] = np.minimum(grad[at_lower], 0)
+                proj_grad[at_upper] = np.maximum(grad[at_upper], 0)
+                np.maximum(pg_max, proj_grad, out=pg_max)
+                np.minimum(pg_min, proj_grad, out=pg_min)
+                moving = np.flatnonzero(np.abs(proj_grad) > 1e-12)
+                if moving.shape[0] == 0:
+                    continue
+                new_a = np.clip(a[moving] - grad[moving] / sq_norms[i], 0, upper)
+                delta = (new_a - a[moving]) * t[moving]
+                alpha[i, moving] = new_a
+                self.W[:, moving] += np.outer(X[i], delta)
+            active = active[keep]
+
+            objective_history[it] = self._ovr_objective(X, targets, reg)
+            gap = np.max(pg_max - pg_min)
+            if verbose:
+                print('pass %d / %d: objective %f, violation %f, active %d'
+                      % (it, max_passes, objective_history[it], gap,
+                         active.shape[0]))
+            if gap <= tol:
+                if active.shape[0] == num_train:
+                    converged = True
+                    break
+                # Converged on the shrunk problem; recheck every example.
+                active = np.arange(num_train)
+                shrink_hi.fill(np.inf)
+                shrink_lo.fill(-np.inf)
+                continue
+            shrink_hi = np.where(pg_max <= 0, np.inf, pg_max)
+            shrink_lo = np.where(pg_min >= 0, -np.inf, pg_min)
+
+        if verbose and not converged:
+            print('not converged after %d passes: violation %f > tol %f'
+                  % (max_passes, gap, tol))
+        return objective_history[:it + 1]
+
+    def _ovr_objective(self, X, targets, reg, chunk_size=10000):
+        """
+        One-vs-rest primal objective minimized by fit, summed over classes.
+        """
+        num_train = X.shape[0]
+        hinge = 0.0
+        for start in range(0, num_train, chunk_size):
+            margins = 1 - targets[start:start + chunk_size] * (
+                X[start:start + chunk_size].dot(self.W))
+            hinge += np.sum(np.maximum(margins, 0))
+        return hinge / num_train + reg * np.sum(self.W * self.W)
+
+    def _train_loss(self, X_batch, y_batch, reg):
+        if issparse(X_batch):
+            # The workspace loss needs dense matmuls with out=.
+            return self.loss(X_batch, y_batch, reg)
+        # One set of buffers per batch shape and dtype, kept for the life of
+        # the model: the epoch samplers alternate between batch_size and a
+        # smaller last minibatch, and both keep their own workspace.
+        key = (X_batch.shape[0],) + self.W.shape + (self.W.dtype,)
+        workspace = self._workspaces.get(key)
+        if workspace is None:
+            workspace = svm_workspace(*key)
+            self._workspaces[key] = workspace
+        return svm_loss_workspace(self.W, X_batch, y_batch, reg, workspace)
+
+
+class Softmax(LinearClassifier):
+    """ A subclass that uses the Softmax + Cross-entropy loss function """
+
+    def loss(self, X_batch, y_batch, reg):
+        return softmax_loss_vectorized(self.W, X_batch, y_batch, reg)
+
+    def loss_many(self, X_batch, y_batch, regs):
+        return softmax_loss_batched(self.W_many, X_batch, y_batch, regs)
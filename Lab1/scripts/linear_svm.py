@@ -66,7 +66,9 @@ def svm_loss_naive(W, X, y, reg):
 def svm_loss_vectorized(W, X, y, reg):
     """
     Structured SVM loss function, vectorized implementation.
-    Inputs and outputs are the same as svm_loss_naive.
+    Inputs and outputs are the same as svm_loss_naive, except that X may also
+    be a sparse CSR matrix (see sparse.py): X only enters through X @ W and
+    X.T @ margin, which are then sparse-dense products.
     """
     loss = 0.0
     dW = np.zeros(W.shape)  # initialize the gradient as zero
@@ -114,4 +116,125 @@ def svm_loss_vectorized(W, X, y, reg):
 
     # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
-    return loss, dW
\ No newline at end of file
+    return loss, dW
+
+
+def svm_workspace(N, D, C, dtype=np.float64):
+    """
+    Preallocate the buffers used by svm_loss_workspace for minibatches of N
+    examples of dimension D and C classes.
+
+    Returns a dictionary of numpy arrays:
+    - scores: (N, C) buffer holding scores, then margins, then the indicator
+      matrix of the gradient.
+    - correct: (N,) scores of the correct classes.
+    - counts: (N,) number of classes violating the margin for each example.
+    - rows, flat: (N,) integer index buffers.
+    - reg_grad: (D, C) regularization gradient.
+    - dW: (D, C) gradient.
+    """
+    return {
+        'scores': np.empty((N, C), dtype=dtype),
+        'correct': np.empty(N, dtype=dtype),
+        'counts': np.empty(N, dtype=dtype),
+        'rows': np.arange(N),
+        'flat': np.empty(N, dtype=np.intp),
+        'reg_grad': np.empty((D, C), dtype=dtype),
+        'dW': np.empty((D, C), dtype=dtype),
+    }
+
+
+def svm_loss_workspace(W, X, y, reg, workspace):
+    """
+    Structured SVM loss function, vectorized implementation that does not
+    allocate: every intermediate lives in the buffers of a workspace made by
+    svm_workspace, updated in place with out= ufuncs, and computations keep
+    the dtype of W and X (a float32 problem stays float32).
+
+    Inputs are the same as svm_loss_naive, plus:
+    - workspace: A dictionary from svm_workspace(N, D, C, W.dtype).
+
+    Returns a tuple of:
+    - loss as single float
+    - gradient with respect to weights W. This is workspace['dW'], which is
+      overwritten by the next call with the same workspace.
+    """
+    num_train, num_classes = X.shape[0], W.shape[1]
+    scores = workspace['scores']
+    correct = workspace['correct']
+    counts = workspace['counts']
+    flat = workspace['flat']
+    dW = workspace['dW']
+
+    np.matmul(X, W, out=scores)
+    # Flat indices of the correct class of every row of scores.
+    np.multiply(workspace['rows'], num_classes, out=flat)
+    flat += y
+    # flat is always in range, so mode='clip' is safe; with the default
+    # mode='raise' np.take fills a temporary before copying it into out.
+    np.take(scores, flat, out=correct, mode='clip')
+
+    scores -= correct[:, np.newaxis]
+    scores += 1
+    np.put(scores, flat, 0)
+    np.maximum(scores, 0, out=scores)
+    loss = np.sum(scores) / num_train + reg * np.vdot(W, W)
+
+    # Turn the margins into the indicator matrix of the gradient.
+    np.greater(scores, 0, out=scores)
+    np.sum(scores, axis=1, out=counts)
+    np.negative(counts, out=counts)
+    np.put(scores, flat, counts)
+
+    np.matmul(X.T, scores, out=dW)
+    dW /= num_train
+    np.multiply(W, 2 * reg, out=workspace['reg_grad'])
+    dW += workspace['reg_grad']
+
+    return float(loss), dW
+
+
+def svm_loss_batched(W, X, y, reg):
+    """
+    Structured SVM loss function for M models that share a minibatch,
+    vectorized over the models.
+
+    The M weight matrices are laid side by side so that the scores of every
+    model come from a single (N, D) x (D, M * C) matrix product, and the
+    gradients from a single (D, N) x (N, M * C) product: the minibatch is
+    read once per step instead of once per model.
+
+    Inputs:
+    - W: A numpy array of shape (M, D, C) containing the weights of M models.
+    - X: A numpy array of shape (N, D) containing a minibatch of data.
+    - y: A numpy array of shape (N,) containing training labels.
+    - reg: A numpy array of shape (M,) giving the regularization strength of
+      each model (or a scalar shared by all of them).
+
+    Returns a tuple of:
+    - loss: A numpy array of shape (M,) with the loss of each model
+    - dW: gradient with respect to W; an array of shape (M, D, C)
+    """
+    num_models, dim, num_classes = W.shape
+    num_train = X.shape[0]
+    reg = np.broadcast_to(np.asarray(reg, dtype=W.dtype), (num_models,))
+    rows = np.arange(num_train)
+
+    W_flat = W.transpose(1, 0, 2).reshape(dim, num_models * num_classes)
+    scores = (X @ W_flat).reshape(num_train, num_models, num_classes)
+
+    margin = scores - scores[rows, :, y][:, :, np.newaxis]
+    margin += 1
+    margin[rows, :, y] = 0
+    np.maximum(margin, 0, out=margin)
+    loss = np.sum(margin, axis=(0, 2)) / num_train
+    loss += reg * np.sum(W * W, axis=(1, 2))
+
+    indicator = (margin > 0).astype(W.dtype)
+    indicator[rows, :, y] = -np.sum(indicator, axis=2)
+    dW = X.T @ indicator.reshape(num_train, num_models * num_classes)
+    dW = dW.reshape(dim, num_models, num_classes).transpose(1, 0, 2)
+    dW /= num_train
+    dW += 2 * reg[:, np.newaxis, np.newaxis] * W
+
+    return loss, dW
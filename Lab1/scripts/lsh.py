@@ -0,0 +1,114 @@
+from builtins import range
+from builtins import object
+import numpy as np
+
+
+class RandomHyperplaneLSH(object):
+    """
+    Random-hyperplane locality sensitive hashing index, in pure numpy.
+
+    Each of num_tables hash tables draws num_bits random hyperplanes through the
+    mean of the indexed data; a point's bucket in a table is the bit pattern
+    of the sides of those hyperplanes it falls on. Nearby points tend to share
+    buckets, so a query only needs to look at the points in its own buckets.
+
+    Recall and speed are traded off with three knobs:
+    - num_tables: more tables give each true neighbor more chances to collide
+      with the query (higher recall, more candidates to scan).
+    - num_bits: more bits make buckets smaller (fewer candidates, lower recall).
+    - num_probes: also visit the buckets reached by flipping, one at a time,
+      the num_probes bits whose hyperplanes lie closest to the query. It only
+      affects queries, so it can be changed after build().
+    """
+
+    def __init__(self, num_tables=8, num_bits=12, num_probes=0, seed=None):
+        """
+        Inputs:
+        - num_tables: Number of independent hash tables.
+        - num_bits: Number of hyperplanes (bits of the bucket key) per table;
+          at most 62.
+        - num_probes: Number of extra buckets visited per table at query time.
+        - seed: Optional seed for the random hyperplanes.
+        """
+        if not 1 <= num_bits <= 62:
+            raise ValueError('Invalid value %d for num_bits' % num_bits)
+        self.num_tables = num_tables
+        self.num_bits = num_bits
+        self.num_probes = num_probes
+        self.seed = seed
+
+    def build(self, X, batch_size=1024):
+        """
+        Hash every row of X into each table.
+
+        Inputs:
+        - X: A numpy array of shape (N, D) of points to index.
+        - batch_size: Number of rows hashed at a time.
+        """
+        num_rows, dim = X.shape
+        rng = np.random.RandomState(self.seed)
+        self.planes = rng.randn(dim, self.num_tables * self.num_bits)
+        self.center = np.zeros(dim)
+        for i in range(0, num_rows, batch_size):
+            self.center += np.sum(X[i:i + batch_size], axis=0, dtype=np.float64)
+        self.center /= max(num_rows, 1)
+
+        codes = np.empty((num_rows, self.num_tables), dtype=np.int64)
+        for i in range(0, num_rows, batch_size):
+            codes[i:i + batch_size] = self.hash(X[i:i + batch_size])[0]
+        # Each table is stored as its points sorted by bucket key, so that the
+        # members of a bucket are one contiguous slice found by searchsorted.
+        self.sorted_idx = np.argsort(codes, axis=0, kind='stable').T.copy()
+        self.sorted_codes = np.take_along_axis(codes.T, self.sorted_idx, axis=1)
+
+    def hash(self, X):
+        """
+        Bucket keys of the rows of X.
+
+        Returns a tuple of:
+        - codes: An int64 array of shape (N, num_tables) of bucket keys.
+        - margins: A float array of shape (N, num_tables, num_bits) giving the
+          signed distance-like projection of each row onto each hyperplane.
+        """
+        proj = np.asarray(X, dtype=np.float64) - self.center
+        margins = (proj @ self.planes).reshape(-1, self.num_tables,
+                                               self.num_bits)
+        powers = np.left_shift(1, np.arange(self.num_bits, dtype=np.int64))
+        codes = (margins > 0).astype(np.int64) @ powers
+        return codes, margins
+
+    def candidates(self, X):
+        """
+        Candidate neighbor indices for every row of X.
+
+        Inputs:
+        - X: A numpy array of shape (num_queries, D).
+
+        Returns:
+        - candidates: A list of num_queries sorted int arrays of indices into
+          the indexed data.
+        """
+        codes, margins = self.hash(X)
+        keys = [codes]
+        if self.num_probes > 0:
+            order = np.argsort(np.abs(margins), axis=2)[:, :, :self.num_probes]
+            for p in range(order.shape[2]):
+                keys.append(codes ^ np.left_shift(1, order[:, :, p]))
+        keys = np.stack(keys, axis=2)
+
+        los = np.empty(keys.shape, dtype=np.intp)
+        his = np.empty(keys.shape, dtype=np.intp)
+        for t in range(self.num_tables):
+            los[:, t] = np.searchsorted(self.sorted_codes[t], keys[:, t], 'left')
+            his[:, t] = np.searchsorted(self.sorted_codes[t], keys[:, t], 'right')
+
+        candidates = []
+        for i in range(keys.shape[0]):
+            members = [self.sorted_idx[t, lo:hi]
+                       for t in range(self.num_tables)
+                       for lo, hi in zip(los[i, t], his[i, t]) if hi > lo]
+            if members:
+                candidates.append(np.unique(np.concatenate(members)))
+            else:
+                candidates.append(np.zeros(0, dtype=np.intp))
+        return candidates
@@ -0,0 +1,31 @@
+from builtins import range
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def num_jobs(n_jobs):
+    """
+    Number of worker threads for n_jobs, where a negative value means one per
+    CPU.
+    """
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    if n_jobs < 0:
+        return os.cpu_count() or 1
+    return int(n_jobs)
+
+
+def for_each_tile(fn, num_rows, tile, n_jobs):
+    """
+    Call fn(start) for every start in range(0, num_rows, tile), spreading the
+    calls over a pool of n_jobs threads. NumPy releases the GIL inside matmul
+    and most reductions, so the tiles run truly in parallel.
+    """
+    starts = range(0, num_rows, tile)
+    if n_jobs == 1:
+        for start in starts:
+            fn(start)
+        return
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        # Consume the results so that exceptions from workers propagate.
+        list(pool.map(fn, starts))
@@ -0,0 +1,104 @@
+from builtins import range
+import numpy as np
+
+
+def softmax_loss_naive(W, X, y, reg):
+    """
+    Softmax loss function, naive implementation (with loops)
+
+    Inputs have dimension D, there are C classes, and we operate on minibatches
+    of N examples.
+
+    Inputs:
+    - W: A numpy array of shape (D, C) containing weights.
+    - X: A numpy array of shape (N, D) containing a minibatch of data.
+    - y: A numpy array of shape (N,) containing training labels; y[i] = c means
+      that X[i] has label c, where 0 <= c < C.
+    - reg: (float) regularization strength
+
+    Returns a tuple of:
+    - loss as single float
+    - gradient with respect to weights W; an array of same shape as W
+    """
+    loss = 0.0
+    dW = np.zeros_like(W)
+
+    num_classes = W.shape[1]
+    num_train = X.shape[0]
+    for i in range(num_train):
+        scores = X[i].dot(W)
+        scores -= np.max(scores)  # shift for numeric stability
+        exp_scores = np.exp(scores)
+        sum_exp = np.sum(exp_scores)
+        loss += np.log(sum_exp) - scores[y[i]]
+        for j in range(num_classes):
+            dW[:, j] += (exp_scores[j] / sum_exp) * X[i]
+        dW[:, y[i]] -= X[i]
+
+    loss /= num_train
+    loss += reg * np.sum(W * W)
+    dW /= num_train
+    dW += reg * W * 2
+
+    return loss, dW
+
+
+def softmax_loss_vectorized(W, X, y, reg):
+    """
+    Softmax loss function, vectorized version.
+
+    The scores are shifted by their row maximum and exponentiated in place, the
+    loss is taken from the log-sum-exp of the shifted scores (so it stays
+    finite even when a probability underflows), and the normalized
+    probabilities are turned into the score gradient in the same buffer.
+
+    Inputs and outputs are the same as softmax_loss_naive.
+    """
+    num_train = X.shape[0]
+    rows = np.arange(num_train)
+
+    probs = X @ W
+    probs -= np.max(probs, axis=1, keepdims=True)
+    correct = probs[rows, y]
+    np.exp(probs, out=probs)
+    sum_exp = np.sum(probs, axis=1, keepdims=True)
+    loss = np.sum(np.log(sum_exp[:, 0]) - correct) / num_train
+    loss += reg * np.sum(W * W)
+
+    probs /= sum_exp
+    probs[rows, y] -= 1
+    dW = X.T @ probs
+    dW /= num_train
+    dW += 2 * reg * W
+
+    return loss, dW
+
+
+def softmax_loss_batched(W, X, y, reg):
+    """
+    Softmax loss function for M models that share a minibatch; the softmax
+    counterpart of linear_svm.svm_loss_batched, with the same inputs and
+    outputs.
+    """
+    num_models, dim, num_classes = W.shape
+    num_train = X.shape[0]
+    reg = np.broadcast_to(np.asarray(reg, dtype=W.dtype), (num_models,))
+    rows = np.arange(num_train)
+
+    W_flat = W.transpose(1, 0, 2).reshape(dim, num_models * num_classes)
+    probs = (X @ W_flat).reshape(num_train, num_models, num_classes)
+    probs -= np.max(probs, axis=2, keepdims=True)
+    correct = probs[rows, :, y]
+    np.exp(probs, out=probs)
+    sum_exp = np.sum(probs, axis=2, keepdims=True)
+    loss = np.sum(np.log(sum_exp[:, :, 0]) - correct, axis=0) / num_train
+    loss += reg * np.sum(W * W, axis=(1, 2))
+
+    probs /= sum_exp
+    probs[rows, :, y] -= 1
+    dW = X.T @ probs.reshape(num_train, num_models * num_classes)
+    dW = dW.reshape(dim, num_models, num_classes).transpose(1, 0, 2)
+    dW /= num_train
+    dW += 2 * reg[:, np.newaxis, np.newaxis] * W
+
+    return loss, dW
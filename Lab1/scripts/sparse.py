@@ -0,0 +1,244 @@
+from builtins import range
+from builtins import object
+import zlib
+
+import numpy as np
+
+
+def issparse(X):
+    """
+    True if X is a CSRMatrix or a scipy.sparse matrix.
+    """
+    return isinstance(X, CSRMatrix) or hasattr(X, 'tocsr')
+
+
+class CSRMatrix(object):
+    """
+    Minimal compressed sparse row matrix, in pure numpy, with just what the
+    linear classifiers need: X @ W, X.T @ G and row selection with slices or
+    index arrays. Memory scales with the number of non-zeros, not with N * D.
+
+    The layout is the usual one (and the same as scipy.sparse.csr_matrix): the
+    non-zeros of row i are data[indptr[i]:indptr[i + 1]], in the columns
+    indices[indptr[i]:indptr[i + 1]]. Duplicate column indices within a row
+    are allowed and add up.
+    """
+
+    def __init__(self, data, indices, indptr, shape):
+        """
+        Inputs:
+        - data: A numpy array of shape (nnz,) of non-zero values.
+        - indices: An integer array of shape (nnz,) of column indices.
+        - indptr: An integer array of shape (N + 1,) of row offsets into data.
+        - shape: The tuple (N, D).
+        """
+        self.data = np.asarray(data)
+        self.indices = np.asarray(indices, dtype=np.intp)
+        self.indptr = np.asarray(indptr, dtype=np.intp)
+        self.shape = (int(shape[0]), int(shape[1]))
+        if self.indptr.shape != (self.shape[0] + 1,):
+            raise ValueError('indptr must have shape (%d,)' % (self.shape[0] + 1))
+        if self.data.shape != self.indices.shape:
+            raise ValueError('data and indices must have the same shape')
+        self._row_ids = None
+        self._column_order = None
+
+    @classmethod
+    def from_dense(cls, X):
+        """
+        CSRMatrix holding the non-zeros of the 2-D array X.
+        """
+        X = np.asarray(X)
+        rows, cols = np.nonzero(X)
+        indptr = np.zeros(X.shape[0] + 1, dtype=np.intp)
+        np.cumsum(np.bincount(rows, minlength=X.shape[0]), out=indptr[1:])
+        return cls(X[rows, cols], cols, indptr, X.shape)
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def nnz(self):
+        return self.data.shape[0]
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def T(self):
+        return _TransposedCSR(self)
+
+    def toarray(self):
+        out = np.zeros(self.shape, dtype=self.dtype)
+        np.add.at(out, (self.row_ids(), self.indices), self.data)
+        return out
+
+    def row_ids(self):
+        """
+        Row index of every stored non-zero, an array of shape (nnz,).
+        """
+        if self._row_ids is None:
+            self._row_ids = np.repeat(np.arange(self.shape[0]),
+                                      np.diff(self.indptr))
+        return self._row_ids
+
+    def __getitem__(self, key):
+        """
+        Select rows with an integer, a slice or an array of row indices.
+        """
+        num_rows = self.shape[0]
+        if isinstance(key, slice):
+            start, stop, step = key.indices(num_rows)
+            if step == 1:
+                # Contiguous rows are a view of the arrays, no copy.
+                stop = max(start, stop)
+                lo, hi = self.indptr[start], self.indptr[stop]
+                return CSRMatrix(self.data[lo:hi], self.indices[lo:hi],
+                                 self.indptr[start:stop + 1] - lo,
+                                 (stop - start, self.shape[1]))
+            key = np.arange(start, stop, step)
+        key = np.atleast_1d(np.asarray(key))
+        if key.dtype == bool:
+            key = np.flatnonzero(key)
+        key = np.where(key < 0, key + num_rows, key)
+        starts = self.indptr[key]
+        lengths = self.indptr[key + 1] - starts
+        indptr = np.zeros(key.shape[0] + 1, dtype=np.intp)
+        np.cumsum(lengths, out=indptr[1:])
+        # Position in self.data of every non-zero of the selected rows.
+        positions = np.arange(indptr[-1]) + np.repeat(starts - indptr[:-1],
+                                                      lengths)
+        return CSRMatrix(self.data[positions], self.indices[positions], indptr,
+                         (key.shape[0], self.shape[1]))
+
+    def __matmul__(self, B):
+        """
+        Dense product self @ B for an array B of shape (D,) or (D, K).
+        """
+        B = np.asarray(B)
+        vector = B.ndim == 1
+        B2 = B[:, np.newaxis] if vector else B
+        out = np.zeros((self.shape[0], B2.shape[1]),
+                       dtype=np.result_type(self.dtype, B2.dtype))
+        if self.nnz > 0:
+            products = self.data[:, np.newaxis] * B2[self.indices]
+            _segment_sum(products, self.indptr, out)
+        return out[:, 0] if vector else out
+
+    dot = __matmul__
+
+    def _rmatmul_transposed(self, G):
+        """
+        Dense product self.T @ G for an array G of shape (N,) or (N, K).
+        """
+        G = np.asarray(G)
+        vector = G.ndim == 1
+        G2 = G[:, np.newaxis] if vector else G
+        out = np.zeros((self.shape[1], G2.shape[1]),
+                       dtype=np.result_type(self.dtype, G2.dtype))
+        if self.nnz > 0:
+            if self._column_order is None:
+                # Non-zeros grouped by column, which turns the transposed
+                # product into segment sums like the direct one.
+                order = np.argsort(self.indices, kind='stable')
+                colptr = np.zeros(self.shape[1] + 1, dtype=np.intp)
+                np.cumsum(np.bincount(self.indices, minlength=self.shape[1]),
+                          out=colptr[1:])
+                self._column_order = (order, colptr)
+            order, colptr = self._column_order
+            products = self.data[order, np.newaxis] * G2[self.row_ids()[order]]
+            _segment_sum(products, colptr, out)
+        return out[:, 0] if vector else out
+
+    def __repr__(self):
+        return '<%dx%d CSRMatrix of type %s with %d stored elements>' % (
+            self.shape[0], self.shape[1], self.dtype, self.nnz)
+
+
+class _TransposedCSR(object):
+    """
+    Transpose of a CSRMatrix, supporting only X.T @ G.
+    """
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.shape = matrix.shape[::-1]
+        self.dtype = matrix.dtype
+
+    def __matmul__(self, G):
+        return self.matrix._rmatmul_transposed(G)
+
+    dot = __matmul__
+
+
+def _segment_sum(values, ptr, out):
+    """
+    out[i] = sum of values[ptr[i]:ptr[i + 1]] for every segment i, leaving the
+    rows of out of empty segments untouched.
+    """
+    nonempty = np.flatnonzero(ptr[1:] > ptr[:-1])
+    if nonempty.shape[0] > 0:
+        # Between the starts of consecutive non-empty segments lie only empty
+        # ones, so reduceat over those starts sums exactly each segment.
+        out[nonempty] = np.add.reduceat(values, ptr[nonempty], axis=0)
+
+
+def _hash_columns(columns, n_features, seed):
+    """
+    Bucket in range(n_features) and sign in {-1, +1} of every integer column
+    id, from a multiplicative hash of the id.
+    """
+    h = (columns.astype(np.uint64) + np.uint64(seed)) * np.uint64(0x9E3779B97F4A7C15)
+    h ^= h >> np.uint64(29)
+    buckets = (h % np.uint64(n_features)).astype(np.intp)
+    signs = np.where(h >> np.uint64(63), -1.0, 1.0)
+    return buckets, signs
+
+
+def hash_features(X, n_features=2 ** 18, seed=0, dtype=np.float64):
+    """
+    The hashing trick: map features with an unbounded (or just very large)
+    number of columns into n_features columns, so that the weights of a
+    linear classifier have a fixed size of n_features x C. Every original
+    feature goes to a pseudo-random column with a pseudo-random sign; the signs
+    make collisions cancel out in expectation instead of piling up.
+
+    Inputs:
+    - X: Either a CSR matrix (a CSRMatrix, or a scipy.sparse CSR matrix) whose
+      column indices are hashed, or a list of N documents, each of which is a
+      dictionary mapping features to values or an iterable of features that
+      each count 1. Features can be strings or integers.
+    - n_features: Number of output columns D.
+    - seed: Seed of the hash function; train and test data must use the same.
+    - dtype: dtype of the values when X is a list of documents.
+
+    Returns:
+    - A CSRMatrix of shape (N, n_features) with the same number of stored
+      values as the input.
+    """
+    if hasattr(X, 'indptr'):
+        data, columns, indptr = X.data, np.asarray(X.indices), X.indptr
+        num_rows = X.shape[0]
+    else:
+        data, columns, lengths = [], [], []
+        for doc in X:
+            items = doc.items() if isinstance(doc, dict) else ((f, 1) for f in doc)
+            n = 0
+            for feature, value in items:
+                if not isinstance(feature, (int, np.integer)):
+                    # zlib.crc32 is stable across runs, unlike hash() on str.
+                    feature = zlib.crc32(str(feature).encode('utf-8'))
+                columns.append(feature)
+                data.append(value)
+                n += 1
+            lengths.append(n)
+        data = np.asarray(data, dtype=dtype)
+        columns = np.asarray(columns, dtype=np.int64)
+        indptr = np.zeros(len(lengths) + 1, dtype=np.intp)
+        np.cumsum(lengths, out=indptr[1:])
+        num_rows = len(lengths)
+    buckets, signs = _hash_columns(columns, n_features, seed)
+    return CSRMatrix(data * signs.astype(np.result_type(data, np.float32)),
+                     buckets, indptr, (num_rows, n_features))
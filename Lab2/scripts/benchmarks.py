@@ -0,0 +1,110 @@
+"""
+Micro-benchmarks for the Lab2 two-layer network. They run on synthetic data of
+CIFAR-10 dimensionality so that no dataset download is needed. Run them from
+the Lab2 directory with
+
+python -m scripts.benchmarks [name ...]
+
+where each name is one of the keys of BENCHMARKS (all of them by default).
+"""
+from __future__ import print_function
+
+from builtins import range
+import time
+import tracemalloc
+
+import numpy as np
+
+from .neural_net import TwoLayerNet
+
+
+def _synthetic_classification(num_train, num_val, dim, num_classes,
+                              signal=0.05):
+    """
+    Gaussian data of CIFAR-10 shape whose classes differ by a small mean shift.
+    """
+    means = signal * np.random.randn(num_classes, dim)
+    y = np.random.randint(num_classes, size=num_train + num_val)
+    X = means[y] + np.random.randn(num_train + num_val, dim)
+    return X[:num_train], y[:num_train], X[num_train:], y[num_train:]
+
+
+def benchmark_loss_buffers(num_train=10000, dim=3072, hidden_size=50,
+                           num_classes=10, batch_size=200, num_iters=200):
+    """
+    Iterations per second of TwoLayerNet.train with and without the
+    preallocated workspace, and the memory one loss and gradient evaluation
+    allocates and frees again (peak traced memory above the steady state,
+    from tracemalloc).
+    """
+    X, y, X_val, y_val = _synthetic_classification(num_train, 100, dim,
+                                                   num_classes)
+    print('TwoLayerNet.train, batch %d x %d dims, hidden %d'
+          % (batch_size, dim, hidden_size))
+    for buffered in (False, True):
+        net = TwoLayerNet(dim, hidden_size, num_classes)
+        # Warm up, which also creates the workspace.
+        net.train(X, y, X_val, y_val, num_iters=1, batch_size=batch_size,
+                  buffered=buffered)
+        tic = time.time()
+        net.train(X, y, X_val, y_val, num_iters=num_iters,
+                  batch_size=batch_size, buffered=buffered)
+        elapsed = time.time() - tic
+
+        X_batch, y_batch = X[:batch_size], y[:batch_size]
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        net.loss(X_batch, y_batch, reg=5e-6, buffered=buffered)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('buffered=%-5s %8.1f iters/sec  %10.1f KB transient per loss'
+              % (buffered, num_iters / elapsed, (peak - base) / 1024.0))
+
+
+def benchmark_update_rules(num_train=10000, num_val=1000, dim=3072,
+                           hidden_size=50, num_classes=10, batch_size=200,
+                           num_epochs=10, target=0.5, reg=1e-3,
+                           learning_rates=(('sgd', 5e-2), ('momentum', 1e-2),
+                                           ('nesterov', 1e-2), ('adam', 5e-4))):
+    """
+    Wall-clock time until the validation accuracy first reaches target, for
+    each update rule of TwoLayerNet.train with its own learning rate. Every
+    epoch costs the same, so the time to target is the training time scaled
+    by the fraction of the epochs needed.
+    """
+    X, y, X_val, y_val = _synthetic_classification(num_train, num_val, dim,
+                                                   num_classes)
+    num_iters = num_epochs * (num_train // batch_size)
+    print('TwoLayerNet update rules, %d train x %d dims, hidden %d, '
+          'target val acc %.2f' % (num_train, dim, hidden_size, target))
+    for update_rule, learning_rate in learning_rates:
+        np.random.seed(0)
+        net = TwoLayerNet(dim, hidden_size, num_classes, std=1e-3)
+        tic = time.time()
+        stats = net.train(X, y, X_val, y_val, learning_rate=learning_rate,
+                          reg=reg, num_iters=num_iters, batch_size=batch_size,
+                          update_rule=update_rule)
+        elapsed = time.time() - tic
+        val_acc = np.asarray(stats['val_acc_history'])
+        reached = np.flatnonzero(val_acc >= target)
+        if reached.shape[0] > 0:
+            epochs = reached[0] + 1
+            result = '%2d epochs, %6.2fs' % (epochs,
+                                             elapsed * epochs / num_epochs)
+        else:
+            result = 'not reached    '
+        print('%-8s lr %-7g: %s  final val acc %.3f'
+              % (update_rule, learning_rate, result, val_acc[-1]))
+
+
+BENCHMARKS = {
+    'loss_buffers': benchmark_loss_buffers,
+    'update_rules': benchmark_update_rules,
+}
+
+
+if __name__ == '__main__':
+    import sys
+    for name in sys.argv[1:] or sorted(BENCHMARKS):
+        BENCHMARKS[name]()
+        print()
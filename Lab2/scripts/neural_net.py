@@ -2,10 +2,166 @@ from __future__ import print_function
 
 from builtins import range
 from builtins import object
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import matplotlib.pyplot as plt
 
 
+def _map_chunks(fn, num_rows, batch_size, n_jobs=1):
+    """
+    Call fn(start) for every start in range(0, num_rows, batch_size), on a pool
+    of n_jobs threads (one per CPU if n_jobs is negative). NumPy releases the
+    GIL inside matmul, so the chunks run in parallel.
+    """
+    if batch_size < 1:
+        raise ValueError('Invalid value %d for batch_size' % batch_size)
+    if n_jobs is not None and n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+    starts = range(0, num_rows, batch_size)
+    if not n_jobs or n_jobs == 1:
+        for start in starts:
+            fn(start)
+        return
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        # Consume the results so that exceptions from workers propagate.
+        list(pool.map(fn, starts))
+
+
+def softmax_cross_entropy(scores, y, workspace=None, return_correct=False):
+    """
+    Fused, numerically stable softmax + cross-entropy loss and gradient.
+
+    The scores are shifted by their row max in place, the log-sum-exp of every
+    row is computed once, and the gradient of the mean loss with respect to
+    the scores is written over the scores: no exp, probability or log array is
+    ever materialized. Because of the shift, exp never sees a positive
+    argument, so large scores cannot overflow to inf or NaN.
+
+    Inputs:
+    - scores: A float array of shape (N, C) of class scores. It is overwritten
+      with the gradient of the loss with respect to the scores.
+    - y: An integer array of shape (N,) of labels, 0 <= y[i] < C.
+    - workspace: Optional dictionary with (N,) buffers 'row' and 'correct' in
+      the dtype of scores, 'flat' of intp and 'rows' = np.arange(N), as
+      created by TwoLayerNet._workspace; without one they are allocated.
+    - return_correct: If True, also return the number of rows whose highest
+      score is the correct class. It comes for free from the shift: those are
+      the rows whose shifted correct score is exactly 0.
+
+    Returns:
+    - loss: The mean cross-entropy loss over the N rows, as a float.
+    - num_correct: Only if return_correct is True; an int.
+    """
+    N, C = scores.shape
+    if workspace is None:
+        workspace = {'row': np.empty(N, dtype=scores.dtype),
+                     'correct': np.empty(N, dtype=scores.dtype),
+                     'flat': np.empty(N, dtype=np.intp),
+                     'rows': np.arange(N)}
+    row, correct, flat = workspace['row'], workspace['correct'], workspace['flat']
+
+    # Flat indices of the correct class of every row.
+    np.multiply(workspace['rows'], C, out=flat)
+    flat += y
+    np.max(scores, axis=1, out=row)
+    scores -= row[:, np.newaxis]
+    # flat is always in range, so mode='clip' is safe; with the default
+    # mode='raise' np.take fills a temporary before copying it into out.
+    np.take(scores, flat, out=correct, mode='clip')
+    if return_correct:
+        num_correct = int(np.count_nonzero(correct == 0))
+    np.exp(scores, out=scores)
+    np.sum(scores, axis=1, out=row)
+    scores /= row[:, np.newaxis]
+    np.log(row, out=row)
+    # log softmax of the correct class is correct - log(sum exp).
+    loss = (np.sum(row) - np.sum(correct)) / N
+
+    np.take(scores, flat, out=correct, mode='clip')
+    correct -= 1
+    np.put(scores, flat, correct)
+    scores /= N
+    if return_correct:
+        return float(loss), num_correct
+    return float(loss)
+
+
+UPDATE_RULES = ('sgd', 'momentum', 'nesterov', 'adam')
+
+
+def _update_config(w, update_rule, optim_config=None):
+    """
+    Per-parameter config dictionary for _update: the hyperparameters of
+    update_rule, defaulted like those of the Lab3 optim module, plus the state
+    buffers of the rule, preallocated in the shape and dtype of w.
+    """
+    config = dict(optim_config or {})
+    if update_rule in ('momentum', 'nesterov'):
+        config.setdefault('momentum', 0.9)
+        config['velocity'] = np.zeros_like(w)
+    elif update_rule == 'adam':
+        config.setdefault('beta1', 0.9)
+        config.setdefault('beta2', 0.999)
+        config.setdefault('epsilon', 1e-8)
+        config['m'] = np.zeros_like(w)
+        config['v'] = np.zeros_like(w)
+        config['t'] = 0
+    if update_rule in ('nesterov', 'adam'):
+        config['scratch'] = np.empty_like(w)
+    return config
+
+
+def _update(w, dw, learning_rate, update_rule, config):
+    """
+    Apply one step of update_rule to w in place. The state in config is
+    updated in place as well, and dw is used as scratch space, so no array is
+    allocated.
+    """
+    if update_rule == 'sgd':
+        dw *= learning_rate
+        w -= dw
+    elif update_rule == 'momentum':
+        v = config['velocity']
+        v *= config['momentum']
+        dw *= learning_rate
+        v -= dw
+        w += v
+    elif update_rule == 'nesterov':
+        # v = mu * v - lr * dw;  w += -mu * v_prev + (1 + mu) * v
+        mu, v, step = config['momentum'], config['velocity'], config['scratch']
+        np.multiply(v, -mu, out=step)
+        v *= mu
+        dw *= learning_rate
+        v -= dw
+        np.multiply(v, 1 + mu, out=dw)
+        step += dw
+        w += step
+    elif update_rule == 'adam':
+        beta1, beta2 = config['beta1'], config['beta2']
+        m, v, step = config['m'], config['v'], config['scratch']
+        config['t'] += 1
+        t = config['t']
+        m *= beta1
+        np.multiply(dw, 1 - beta1, out=step)
+        m += step
+        v *= beta2
+        np.square(dw, out=step)
+        step *= 1 - beta2
+        v += step
+        # w -= lr * m_hat / (sqrt(v_hat) + eps), with the bias corrections
+        # m_hat = m / (1 - beta1^t) and v_hat = v / (1 - beta2^t).
+        np.sqrt(v, out=step)
+        step /= np.sqrt(1 - beta2 ** t)
+        step += config['epsilon']
+        np.divide(m, step, out=step)
+        step *= learning_rate / (1 - beta1 ** t)
+        w -= step
+    else:
+        raise ValueError('Invalid update_rule "%s"' % update_rule)
+
+
 class TwoLayerNet(object):
     """
     A two-layer fully-connected neural network. The net has an input dimension of
@@ -42,8 +198,9 @@ class TwoLayerNet(object):
         self.params['b1'] = np.zeros(hidden_size)
         self.params['W2'] = std * np.random.randn(hidden_size, output_size)
         self.params['b2'] = np.zeros(output_size)
+        self._workspaces = {}
 
-    def loss(self, X, y=None, reg=0.0):
+    def loss(self, X, y=None, reg=0.0, buffered=False, return_correct=False):
         """
         Compute the loss and gradients for a two layer fully connected neural
         network.
@@ -55,6 +212,12 @@ class TwoLayerNet(object):
           is not passed then we only return scores, and if it is passed then we
           instead return the loss and gradients.
         - reg: Regularization strength.
+        - buffered: If True (and y is given), run the forward and backward
+          passes in the preallocated buffers of the workspace for this batch
+          size (see _loss_buffered). The returned gradients are then views of
+          those buffers and are overwritten by the next buffered call.
+        - return_correct: If True (and y is given), also return the number of
+          examples of the batch whose highest score is their label.
 
         Returns:
         If y is None, return a matrix scores of shape (N, C) where scores[i, c] is
@@ -65,7 +228,11 @@ class TwoLayerNet(object):
           samples.
         - grads: Dictionary mapping parameter names to gradients of those parameters
           with respect to the loss function; has the same keys as self.params.
+        - num_correct: Only if return_correct is True; an int.
         """
+        if buffered and y is not None:
+            return self._loss_buffered(X, y, reg, return_correct)
+
         # Unpack variables from the params dictionary
         W1, b1 = self.params['W1'], self.params['b1']
         W2, b2 = self.params['W2'], self.params['b2']
@@ -99,13 +266,9 @@ class TwoLayerNet(object):
         #############################################################################
         # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
-        # находим вероятности
-        exp_scores = np.exp(scores)
-        probs = exp_scores / np.sum(exp_scores, axis=1, keepdims=True)  # [N x K]
-
-        # средняя кросс энтропийная потеря и регуляризация
-        cor_logprob = -np.log(probs[range(N), y])
-        loss = cor_logprob.sum() / N
+        # средняя кросс энтропийная потеря и регуляризация; scores are not
+        # returned past this point, so the kernel turns them into their gradient
+        loss, num_correct = softmax_cross_entropy(scores, y, return_correct=True)
         loss += reg * (np.sum(W1 ** 2) + np.sum(W2 ** 2))
 
         # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
@@ -119,10 +282,8 @@ class TwoLayerNet(object):
         #############################################################################
         # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
-        # Находим градиент
-        grad_scores = probs
-        grad_scores[range(N),y] -= 1
-        grad_scores /= N
+        # Находим градиент (already computed by softmax_cross_entropy)
+        grad_scores = scores
         # Обратное распространение ошибки
         grads['W2'] = h_l.T@grad_scores + 2 * reg * W2 # + regularization gradient contribution
         grads['b2'] = np.sum(grad_scores, axis=0)
@@ -136,15 +297,105 @@ class TwoLayerNet(object):
 
         # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
+        if return_correct:
+            return loss, grads, num_correct
         return loss, grads
 
+    def _workspace(self, N, dtype):
+        """
+        Buffers for a batch of N examples, created on first use and kept for
+        as long as the model lives. train() uses a single batch size, so after
+        the first iteration every step reuses the same arrays.
+
+        Returns a dictionary of numpy arrays; the keys are named after the
+        intermediates of loss() plus the gradients, and small index buffers.
+        train() adds an (N, D) minibatch buffer X_batch in the dtype of its
+        training data.
+        """
+        (D, H), C = self.params['W1'].shape, self.params['W2'].shape[1]
+        key = (N, D, H, C, np.dtype(dtype))
+        workspace = self._workspaces.get(key)
+        if workspace is None:
+            workspace = {
+                'h_l': np.empty((N, H), dtype=dtype),
+                'relu_mask': np.empty((N, H), dtype=dtype),
+                'back_h': np.empty((N, H), dtype=dtype),
+                'scores': np.empty((N, C), dtype=dtype),
+                'row': np.empty(N, dtype=dtype),
+                'correct': np.empty(N, dtype=dtype),
+                'rows': np.arange(N),
+                'flat': np.empty(N, dtype=np.intp),
+                'W1': np.empty((D, H), dtype=dtype),
+                'b1': np.empty(H, dtype=dtype),
+                'W2': np.empty((H, C), dtype=dtype),
+                'b2': np.empty(C, dtype=dtype),
+                'reg_W1': np.empty((D, H), dtype=dtype),
+                'reg_W2': np.empty((H, C), dtype=dtype),
+            }
+            self._workspaces[key] = workspace
+        return workspace
+
+    def _loss_buffered(self, X, y, reg, return_correct=False):
+        """
+        Same loss and gradients as loss(X, y, reg), computed without
+        allocating: every intermediate is written into the workspace for this
+        batch size with out= matmuls and in-place ufuncs.
+        """
+        W1, b1 = self.params['W1'], self.params['b1']
+        W2, b2 = self.params['W2'], self.params['b2']
+        N = X.shape[0]
+        ws = self._workspace(N, np.result_type(X, W1))
+        h_l, scores = ws['h_l'], ws['scores']
+
+        # Forward pass
+        np.matmul(X, W1, out=h_l)
+        h_l += b1
+        np.maximum(h_l, 0, out=h_l)
+        np.matmul(h_l, W2, out=scores)
+        scores += b2
+
+        # Softmax loss; scores becomes the gradient on the scores.
+        loss, num_correct = softmax_cross_entropy(scores, y, ws,
+                                                  return_correct=True)
+        loss += reg * (np.vdot(W1, W1) + np.vdot(W2, W2))
+
+        # Backward pass
+        grads = {'W1': ws['W1'], 'b1': ws['b1'], 'W2': ws['W2'], 'b2': ws['b2']}
+        np.matmul(h_l.T, scores, out=grads['W2'])
+        np.multiply(W2, 2 * reg, out=ws['reg_W2'])
+        grads['W2'] += ws['reg_W2']
+        np.sum(scores, axis=0, out=grads['b2'])
+
+        back_h = ws['back_h']
+        np.matmul(scores, W2.T, out=back_h)
+        # h_l >= 0 after the ReLU, so its sign is the 0/1 mask of the ReLU
+        # gradient, already in the float dtype (a bool mask would be cast
+        # through a temporary buffer).
+        np.sign(h_l, out=ws['relu_mask'])
+        back_h *= ws['relu_mask']
+        np.matmul(X.T, back_h, out=grads['W1'])
+        np.multiply(W1, 2 * reg, out=ws['reg_W1'])
+        grads['W1'] += ws['reg_W1']
+        np.sum(back_h, axis=0, out=grads['b1'])
+
+        if return_correct:
+            return float(loss), grads, num_correct
+        return float(loss), grads
+
     def train(self, X, y, X_val, y_val,
               learning_rate=1e-3, learning_rate_decay=0.95,
               reg=5e-6, num_iters=100,
-              batch_size=200, verbose=False):
+              batch_size=200, verbose=False, buffered=True, sampler='epoch',
+              update_rule='sgd', optim_config=None):
         """
         Train this neural network using stochastic gradient descent.
 
+        An epoch is num_train // batch_size iterations. At the end of every
+        epoch the learning rate is decayed and the train and validation
+        accuracies are recorded: the train accuracy is that of the minibatches
+        of the epoch, counted from the scores of each step's own forward pass,
+        and the validation accuracy comes from the chunked predict.
+
         Inputs:
         - X: A numpy array of shape (N, D) giving training data.
         - y: A numpy array f shape (N,) giving training labels; y[i] = c means that
@@ -158,9 +409,29 @@ class TwoLayerNet(object):
         - num_iters: Number of steps to take when optimizing.
         - batch_size: Number of training examples to use per step.
         - verbose: boolean; if true print progress during optimization.
+        - buffered: boolean; if true run every step in the preallocated
+          workspace of the model (see loss), so that steps do not allocate.
+        - sampler: 'epoch' visits the examples in a new random order every
+          epoch, without replacement; 'random' samples every minibatch with
+          replacement.
+        - update_rule: 'sgd', 'momentum', 'nesterov' (momentum with a Nesterov
+          look-ahead) or 'adam'. The state of the rule lives in buffers
+          allocated once per parameter and updated in place.
+        - optim_config: Optional dictionary of hyperparameters of the update
+          rule other than the learning rate: momentum (default 0.9) for
+          'momentum' and 'nesterov'; beta1 (0.9), beta2 (0.999) and epsilon
+          (1e-8) for 'adam'.
         """
+        if sampler not in ('epoch', 'random'):
+            raise ValueError('Invalid sampler "%s"' % sampler)
+        if update_rule not in UPDATE_RULES:
+            raise ValueError('Invalid update_rule "%s"' % update_rule)
+        configs = {p: _update_config(w, update_rule, optim_config)
+                   for p, w in self.params.items()}
         num_train = X.shape[0]
-        iterations_per_epoch = max(num_train / batch_size, 1)
+        batch_size = min(batch_size, num_train)
+        iterations_per_epoch = max(num_train // batch_size, 1)
+        epoch_correct = 0
 
         # Use SGD to optimize the parameters in self.model
         loss_history = []
@@ -177,14 +448,36 @@ class TwoLayerNet(object):
             #########################################################################
             # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
-            idx = np.random.choice(X.shape[0], size=batch_size)
-            X_batch, y_batch = X[idx], y[idx]
+            step = it % iterations_per_epoch
+            if sampler == 'epoch':
+                if step == 0:
+                    order = np.random.permutation(num_train)
+                idx = order[step * batch_size:(step + 1) * batch_size]
+            else:
+                idx = np.random.choice(num_train, size=batch_size)
+            if buffered:
+                # The batch buffer keeps the dtype of X (np.take cannot cast
+                # into out); the out= matmuls of the loss upcast from it.
+                ws = self._workspace(batch_size,
+                                     np.result_type(X, self.params['W1']))
+                if ws.get('X_batch') is None or ws['X_batch'].dtype != X.dtype:
+                    ws['X_batch'] = np.empty((batch_size,) + X.shape[1:],
+                                             dtype=X.dtype)
+                # idx is in range, so mode='clip' is safe; it lets np.take
+                # write straight into the batch buffer.
+                X_batch = np.take(X, idx, axis=0, mode='clip', out=ws['X_batch'])
+            else:
+                X_batch = X[idx]
+            y_batch = y[idx]
 
             # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
             # Compute loss and gradients using the current minibatch
-            loss, grads = self.loss(X_batch, y=y_batch, reg=reg)
+            loss, grads, num_correct = self.loss(X_batch, y=y_batch, reg=reg,
+                                                 buffered=buffered,
+                                                 return_correct=True)
             loss_history.append(loss)
+            epoch_correct += num_correct
 
             #########################################################################
             # TODO: Use the gradients in the grads dictionary to update the         #
@@ -195,7 +488,10 @@ class TwoLayerNet(object):
             # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
             for param in self.params:
-                self.params[param] -= learning_rate * grads[param].reshape(self.params[param].shape)
+                # The gradients are not needed after the step, so the update
+                # may use them as scratch space.
+                _update(self.params[param], grads[param], learning_rate,
+                        update_rule, configs[param])
 
             # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
@@ -203,12 +499,13 @@ class TwoLayerNet(object):
                 print('iteration %d / %d: loss %f' % (it, num_iters, loss))
 
             # Every epoch, check train and val accuracy and decay learning rate.
-            if it % iterations_per_epoch == 0:
+            if step == iterations_per_epoch - 1:
                 # Check accuracy
-                train_acc = (self.predict(X_batch) == y_batch).mean()
+                train_acc = epoch_correct / float(iterations_per_epoch * batch_size)
                 val_acc = (self.predict(X_val) == y_val).mean()
                 train_acc_history.append(train_acc)
                 val_acc_history.append(val_acc)
+                epoch_correct = 0
 
                 # Decay learning rate
                 learning_rate *= learning_rate_decay
@@ -219,7 +516,7 @@ class TwoLayerNet(object):
           'val_acc_history': val_acc_history,
         }
 
-    def predict(self, X):
+    def predict(self, X, batch_size=10000, n_jobs=1):
         """
         Use the trained weights of this two-layer network to predict labels for
         data points. For each data point we predict scores for each of the C
@@ -227,7 +524,11 @@ class TwoLayerNet(object):
 
         Inputs:
         - X: A numpy array of shape (N, D) giving N D-dimensional data points to
-          classify.
+          classify. It may be an np.memmap; only batch_size rows are read into
+          memory at a time.
+        - batch_size: Number of rows pushed through the network at a time.
+        - n_jobs: Number of threads processing chunks concurrently; a negative
+          value means one per CPU.
 
         Returns:
         - y_pred: A numpy array of shape (N,) giving predicted labels for each of
@@ -241,9 +542,21 @@ class TwoLayerNet(object):
         ###########################################################################
         # *****START OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
-        res = self.loss(X)
-        y_pred = np.argmax(res, axis=1)
+        W1, b1 = self.params['W1'], self.params['b1']
+        W2, b2 = self.params['W2'], self.params['b2']
+        y_pred = np.empty(X.shape[0], dtype=np.intp)
+
+        def predict_chunk(start):
+            # Forward pass only: no loss, no cached activations for backprop.
+            h_l = X[start:start + batch_size] @ W1
+            h_l += b1
+            np.maximum(h_l, 0, out=h_l)
+            scores = h_l @ W2
+            scores += b2
+            np.argmax(scores, axis=1, out=y_pred[start:start + batch_size])
+
+        _map_chunks(predict_chunk, X.shape[0], batch_size, n_jobs)
 
         # *****END OF YOUR CODE (DO NOT DELETE/MODIFY THIS LINE)*****
 
-        return y_pred
\ No newline at end of file
+        return y_pred
@@ -835,14 +835,18 @@ def softmax_loss(x, y):
     - loss: Scalar giving the loss
     - dx: Gradient of the loss with respect to x
     """
-    shifted_logits = x - np.max(x, axis=1, keepdims=True)
-    Z = np.sum(np.exp(shifted_logits), axis=1, keepdims=True)
-    log_probs = shifted_logits - np.log(Z)
-    probs = np.exp(log_probs)
+    # Fused kernel: one copy of x becomes the shifted logits, then the
+    # probabilities, then dx, and the log-sum-exp is computed once per row.
     N = x.shape[0]
-    loss = -np.sum(log_probs[np.arange(N), y]) / N
-    dx = probs.copy()
-    dx[np.arange(N), y] -= 1
+    rows = np.arange(N)
+    dx = np.array(x, dtype=np.result_type(x, np.float32))
+    dx -= np.max(dx, axis=1, keepdims=True)
+    correct = dx[rows, y]
+    np.exp(dx, out=dx)
+    Z = np.sum(dx, axis=1)
+    loss = (np.sum(np.log(Z)) - np.sum(correct)) / N
+    dx /= Z[:, np.newaxis]
+    dx[rows, y] -= 1
     dx /= N
     return loss, dx
 